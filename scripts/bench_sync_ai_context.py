@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""合成 canonical コーパスで sync_ai_context.py の性能を計測し、ベースラインと比較する。"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import sync_ai_context as sync  # noqa: E402
+
+SCALES = {
+    "small": {"playbooks": 10, "routing_rows": 20, "doc_lines": 40, "frontmatter_ratio": 0.5},
+    "medium": {"playbooks": 100, "routing_rows": 200, "doc_lines": 150, "frontmatter_ratio": 0.5},
+    "large": {"playbooks": 500, "routing_rows": 1000, "doc_lines": 300, "frontmatter_ratio": 0.5},
+}
+WORDS = [
+    "canonical",
+    "playbook",
+    "routing",
+    "生成",
+    "検証",
+    "差分",
+    "手順",
+    "レビュー",
+    "`uv run pytest`",
+    "CI",
+    "ドキュメント",
+    "実装",
+]
+NOISE_FLOOR_SECONDS = 0.001
+
+
+def synthetic_paragraph(rng: random.Random, words: int) -> str:
+    """ランダムな語を並べた 1 文を返す。"""
+    return " ".join(rng.choice(WORDS) for _ in range(words)) + "。"
+
+
+def synthetic_document(rng: random.Random, title: str, lines: int) -> str:
+    """見出し・箇条書き・本文を混ぜた markdown を返す。"""
+    body = [f"# {title}", ""]
+    for index in range(lines):
+        if index % 20 == 0:
+            body.extend(["", f"## セクション {index // 20 + 1}", ""])
+        elif index % 3 == 0:
+            body.append(synthetic_paragraph(rng, 12))
+        else:
+            body.append(f"- {synthetic_paragraph(rng, 8)}")
+    return "\n".join(body) + "\n"
+
+
+def generate_corpus(
+    root: Path,
+    playbooks: int,
+    routing_rows: int,
+    doc_lines: int,
+    frontmatter_ratio: float,
+    seed: int = 0,
+) -> list[str]:
+    """root に合成 canonical 一式を生成し、playbook 名一覧を返す。"""
+    rng = random.Random(seed)
+    playbook_names = [f"synthetic-playbook-{index:04d}" for index in range(playbooks)]
+
+    rows = ["| 判断ケース | この条件なら使う | 参照先Playbook |", "| --- | --- | --- |"]
+    for index in range(routing_rows):
+        name = playbook_names[index % len(playbook_names)] if playbook_names else "none"
+        rows.append(
+            f"| ケース {index} | {synthetic_paragraph(rng, 6)} | "
+            f"[{name}](docs/ai/playbooks/{name}.md) |"
+        )
+    routing = "# タスクルーティング\n\n" + "\n".join(rows) + "\n\n## 使い分けルール\n\n"
+    routing += "\n".join(f"- {synthetic_paragraph(rng, 8)}" for _ in range(10)) + "\n"
+
+    documents = {
+        sync.CANONICAL_FILES["global"]: synthetic_document(rng, "グローバルポリシー", doc_lines),
+        sync.CANONICAL_FILES["routing"]: routing,
+        sync.CANONICAL_FILES["coding"]: synthetic_document(rng, "コーディング標準", doc_lines),
+    }
+    for name in playbook_names:
+        markdown = synthetic_document(rng, name, doc_lines)
+        if rng.random() < frontmatter_ratio:
+            markdown = (
+                f"---\nname: {name}\ndescription: {synthetic_paragraph(rng, 20)}\n---\n\n"
+                + markdown
+            )
+        documents[sync.PLAYBOOK_CANONICAL_DIR / f"{name}.md"] = markdown
+
+    for rel_path, content in documents.items():
+        path = root / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+    return playbook_names
+
+
+def measure(func: Callable[[], object], repeat: int) -> float:
+    """func を repeat 回実行した所要時間の中央値（秒）を返す。"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def run_sync(root: Path, *extra: str) -> int:
+    """sync_ai_context を同一プロセスで実行する（標準出力は捨てる）。"""
+    args = sync.parse_args(["--root", str(root), *extra])
+    with contextlib.redirect_stdout(io.StringIO()):
+        return sync.run(args)
+
+
+def bench_scale(config: dict, repeat: int, seed: int) -> dict[str, float]:
+    """1 つの規模設定について、関数単位とシナリオ単位の所要時間を返す。"""
+    results: dict[str, float] = {}
+    with tempfile.TemporaryDirectory(prefix="ai-context-bench-") as tmp:
+        root = Path(tmp)
+        playbook_names = generate_corpus(root, seed=seed, **config)
+        state = sync.load_sync_state(root)
+        routing_text = state.canonical["routing"].text
+
+        results["extract_playbook_routes.parsed"] = measure(
+            lambda: sync.extract_playbook_routes(state.canonical["routing"]), repeat
+        )
+        results["extract_playbook_routes.text"] = measure(
+            lambda: sync.extract_playbook_routes(routing_text), repeat
+        )
+        results["load_sync_state"] = measure(lambda: sync.load_sync_state(root), repeat)
+
+        def build() -> dict[Path, str]:
+            return sync.build_outputs(
+                state.canonical, state.playbook_routes, state.playbooks, digests=state.digests
+            )
+
+        results["build_outputs"] = measure(build, repeat)
+        outputs = build()
+
+        def cold_write() -> None:
+            for rel_path in outputs:
+                (root / rel_path).unlink(missing_ok=True)
+            sync.write_outputs(root, outputs)
+
+        results["write_outputs.cold"] = measure(cold_write, repeat)
+        results["write_outputs.warm"] = measure(lambda: sync.write_outputs(root, outputs), repeat)
+        results["check_outputs"] = measure(lambda: sync.check_outputs(root, outputs), repeat)
+
+        cache_dir = root / sync.MANIFEST_PATH.parent
+
+        def scenario_cold() -> None:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            for rel_path in outputs:
+                (root / rel_path).unlink(missing_ok=True)
+            run_sync(root)
+
+        def scenario_warm() -> None:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            run_sync(root)
+
+        results["scenario.cold"] = measure(scenario_cold, repeat)
+        results["scenario.warm"] = measure(scenario_warm, repeat)
+        run_sync(root)
+        results["scenario.no_change"] = measure(lambda: run_sync(root), repeat)
+        results["scenario.check_no_change"] = measure(lambda: run_sync(root, "--check"), repeat)
+        results["scenario.check_header_only"] = measure(
+            lambda: run_sync(root, "--check", "--header-only"), repeat
+        )
+
+        if playbook_names:
+            target = root / sync.PLAYBOOK_CANONICAL_DIR / f"{playbook_names[0]}.md"
+            original = target.read_text(encoding="utf-8")
+            counter = iter(range(1_000_000))
+
+            def scenario_one_file_changed() -> None:
+                target.write_text(f"{original}\n- 変更 {next(counter)}\n", encoding="utf-8")
+                run_sync(root)
+
+            results["scenario.one_file_changed"] = measure(scenario_one_file_changed, repeat)
+    return results
+
+
+def current_commit() -> str | None:
+    """計測対象のコミットを返す。git がなければ None。"""
+    try:
+        completed = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+    except OSError:
+        return None
+    return completed.stdout.strip() or None
+
+
+def compare_with_baseline(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """ベースラインより tolerance 倍を超えて遅くなった計測項目を返す。"""
+    regressions: list[str] = []
+    for scale, scale_result in current["scales"].items():
+        baseline_results = baseline.get("scales", {}).get(scale, {}).get("results", {})
+        for metric, seconds in scale_result["results"].items():
+            previous = baseline_results.get(metric)
+            if previous is None or seconds < NOISE_FLOOR_SECONDS:
+                continue
+            if seconds > previous * tolerance:
+                regressions.append(
+                    f"{scale}/{metric}: {previous * 1000:.2f} ms -> {seconds * 1000:.2f} ms "
+                    f"(x{seconds / previous:.2f})"
+                )
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    """CLI 引数を解析する。"""
+    parser = argparse.ArgumentParser(description="sync_ai_context.py benchmark suite")
+    parser.add_argument(
+        "--scale",
+        action="append",
+        choices=sorted(SCALES),
+        help="計測する規模プリセット。複数指定可（既定: small, medium）",
+    )
+    parser.add_argument("--playbooks", type=int, help="カスタム規模: playbook 数")
+    parser.add_argument("--routing-rows", type=int, help="カスタム規模: ルーティング表の行数")
+    parser.add_argument("--doc-lines", type=int, help="カスタム規模: 1 文書あたりの行数")
+    parser.add_argument(
+        "--frontmatter-ratio",
+        type=float,
+        default=0.5,
+        help="カスタム規模: frontmatter を持つ playbook の割合（既定: 0.5）",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="各計測の繰り返し回数（既定: 5）")
+    parser.add_argument("--seed", type=int, default=0, help="コーパス生成の乱数シード")
+    parser.add_argument("--output", help="計測結果 JSON の保存先（ベースラインとして再利用できる）")
+    parser.add_argument("--baseline", help="比較対象のベースライン JSON")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.3,
+        help="ベースライン比でこの倍率を超えたら回帰とみなす（既定: 1.3）",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    """メイン処理。"""
+    args = parse_args()
+    scales: dict[str, dict] = {}
+    if args.playbooks is not None:
+        scales["custom"] = {
+            "playbooks": args.playbooks,
+            "routing_rows": args.routing_rows or args.playbooks,
+            "doc_lines": args.doc_lines or 100,
+            "frontmatter_ratio": args.frontmatter_ratio,
+        }
+    for name in args.scale or ([] if scales else ["small", "medium"]):
+        scales[name] = SCALES[name]
+
+    report = {
+        "commit": current_commit(),
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "scales": {},
+    }
+    for name, config in scales.items():
+        print(f"[BENCH] {name}: {config}", flush=True)
+        results = bench_scale(config, args.repeat, args.seed)
+        report["scales"][name] = {"config": config, "results": results}
+        for metric, seconds in results.items():
+            print(f"  {metric:<32} {seconds * 1000:10.3f} ms")
+
+    if args.output:
+        output = Path(args.output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+        print(f"[OK] Saved results: {output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare_with_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print(f"[NG] Regressions against {args.baseline} (commit {baseline.get('commit')}):")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print(f"[OK] No regressions against {args.baseline} (commit {baseline.get('commit')}).")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""canonical と playbook 参照資料の間で、ほぼ同じ段落を MinHash/LSH で検出する。"""
+
+from __future__ import annotations
+
+import argparse
+import re
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+
+SOURCE_DIRS = (Path("docs/ai/canonical"), Path("docs/ai/playbook-assets"))
+DIRECTIVE_PATTERN = re.compile(r"<!--\s*ai-context:.*?-->")
+NORMALIZE_PATTERN = re.compile(r"[\s`*_>#|\-:：、。,.()（）\[\]]+")
+HASH_MASK = (1 << 32) - 1
+HASH_MULTIPLIER = 0x9E3779B1
+
+
+@dataclass(frozen=True)
+class Paragraph:
+    """空行で区切られた段落と、その位置。"""
+
+    path: Path
+    start: int
+    end: int
+    text: str
+
+
+def iter_source_files(root: Path) -> list[Path]:
+    """検査対象の Markdown ファイルを決定的な順序で返す。"""
+    files: list[Path] = []
+    for source_dir in SOURCE_DIRS:
+        files.extend(sorted((root / source_dir).rglob("*.md")))
+    return files
+
+
+def split_paragraphs(rel_path: Path, text: str) -> list[Paragraph]:
+    """frontmatter・見出し・ディレクティブを除き、空行区切りの段落を返す。行番号は 1 始まり。"""
+    lines = text.splitlines()
+    start_index = 0
+    if lines and lines[0] == "---":
+        for index in range(1, len(lines)):
+            if lines[index].startswith("---"):
+                start_index = index + 1
+                break
+
+    paragraphs: list[Paragraph] = []
+    block: list[tuple[int, str]] = []
+    in_fence = False
+
+    def flush() -> None:
+        if block:
+            text = "\n".join(line for _, line in block)
+            paragraphs.append(Paragraph(rel_path, block[0][0] + 1, block[-1][0] + 1, text))
+            block.clear()
+
+    for index in range(start_index, len(lines)):
+        line = lines[index]
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            in_fence = not in_fence
+        if not in_fence and (not stripped or stripped.startswith("#")):
+            flush()
+            continue
+        if DIRECTIVE_PATTERN.fullmatch(stripped):
+            continue
+        block.append((index, line))
+    flush()
+    return paragraphs
+
+
+def normalize(text: str) -> str:
+    """記号と空白の差を無視できるように正規化する。"""
+    return NORMALIZE_PATTERN.sub(" ", text.lower()).strip()
+
+
+def shingles(text: str, size: int) -> set[int]:
+    """文字 n-gram の 32bit ハッシュ集合を返す。日本語は分かち書きしないため文字単位にする。"""
+    if len(text) <= size:
+        grams = [text]
+    else:
+        grams = [text[index : index + size] for index in range(len(text) - size + 1)]
+    return {(zlib.crc32(gram.encode("utf-8")) * HASH_MULTIPLIER) & HASH_MASK for gram in grams}
+
+
+def minhash(shingle_set: set[int], size: int) -> tuple[int, ...]:
+    """shingle 集合の MinHash 署名を 1 回の走査で返す。
+
+    ハッシュ関数を size 個使う代わりに、ハッシュ値を size 個のビンに振り分けてビンごとの最小値を
+    取る（one permutation hashing）。空のビンは次の空でないビンの値で埋める（rotation densification）。
+    """
+    bins: list[int | None] = [None] * size
+    for value in shingle_set:
+        index, rank = value % size, value // size
+        current = bins[index]
+        if current is None or rank < current:
+            bins[index] = rank
+    if all(value is None for value in bins):
+        return tuple([HASH_MASK] * size)
+    signature: list[int] = []
+    for index in range(size):
+        offset = 0
+        value = bins[index]
+        while value is None:
+            offset += 1
+            value = bins[(index + offset) % size]
+        signature.append(value + offset * (HASH_MASK // size + 1))
+    return tuple(signature)
+
+
+def jaccard(left: set[int], right: set[int]) -> float:
+    """2 つの集合の Jaccard 係数を返す。"""
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+def find_duplicates(
+    paragraphs: list[Paragraph],
+    threshold: float,
+    shingle_size: int = 5,
+    bands: int = 16,
+    rows: int = 4,
+) -> list[tuple[float, list[Paragraph]]]:
+    """LSH で候補対を絞り、Jaccard 係数が threshold 以上の段落をクラスタにまとめて返す。
+
+    全段落の組み合わせは比較せず、MinHash 署名を bands 個の帯に分けて同じバケットに入った
+    段落どうしだけを比較する。クラスタは (クラスタ内の最大類似度, 段落一覧) で返す。
+    """
+    shingle_sets = [shingles(normalize(paragraph.text), shingle_size) for paragraph in paragraphs]
+    buckets: dict[tuple[int, tuple[int, ...]], list[int]] = defaultdict(list)
+    for index, shingle_set in enumerate(shingle_sets):
+        signature = minhash(shingle_set, bands * rows)
+        for band in range(bands):
+            buckets[(band, signature[band * rows : (band + 1) * rows])].append(index)
+
+    parent = list(range(len(paragraphs)))
+
+    def find(index: int) -> int:
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    compared: set[tuple[int, int]] = set()
+    similarity: dict[int, float] = defaultdict(float)
+    for members in buckets.values():
+        for position, left in enumerate(members):
+            for right in members[position + 1 :]:
+                if (left, right) in compared or find(left) == find(right):
+                    continue
+                compared.add((left, right))
+                score = jaccard(shingle_sets[left], shingle_sets[right])
+                if score < threshold:
+                    continue
+                left_root, right_root = find(left), find(right)
+                if left_root != right_root:
+                    parent[right_root] = left_root
+                    similarity[left_root] = max(
+                        similarity[left_root], similarity.pop(right_root, 0.0)
+                    )
+                root = find(left)
+                similarity[root] = max(similarity[root], score)
+
+    clusters: dict[int, list[Paragraph]] = defaultdict(list)
+    for index, paragraph in enumerate(paragraphs):
+        clusters[find(index)].append(paragraph)
+    return sorted(
+        (
+            (similarity[root], members)
+            for root, members in clusters.items()
+            if len(members) > 1
+        ),
+        key=lambda cluster: (-cluster[0], cluster[1][0].path.as_posix(), cluster[1][0].start),
+    )
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """CLI 引数を解析する。"""
+    parser = argparse.ArgumentParser(
+        description=(
+            "docs/ai/canonical/** と docs/ai/playbook-assets/** から、"
+            "ほぼ同じ段落（同じ手順の二重記載）を検出する"
+        )
+    )
+    parser.add_argument(
+        "--root",
+        default=".",
+        help="リポジトリルートパス（既定: カレントディレクトリ）",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.8,
+        help=(
+            "重複とみなす類似度（文字 n-gram の Jaccard 係数、既定: 0.8）。"
+            "該当する段落があれば終了コード 1 を返す"
+        ),
+    )
+    parser.add_argument(
+        "--min-chars",
+        type=int,
+        default=40,
+        help="検査対象にする段落の最小文字数（正規化後、既定: 40）",
+    )
+    parser.add_argument(
+        "--shingle-size",
+        type=int,
+        default=5,
+        help="shingle の文字数（既定: 5）",
+    )
+    args = parser.parse_args(argv)
+    if not 0.0 < args.threshold <= 1.0:
+        parser.error("--threshold must be in (0, 1]")
+    return args
+
+
+def main() -> int:
+    """メイン処理。"""
+    args = parse_args()
+    root = Path(args.root).resolve()
+    paragraphs: list[Paragraph] = []
+    for path in iter_source_files(root):
+        rel_path = path.relative_to(root)
+        paragraphs.extend(
+            paragraph
+            for paragraph in split_paragraphs(rel_path, path.read_text(encoding="utf-8"))
+            if len(normalize(paragraph.text)) >= args.min_chars
+        )
+
+    clusters = find_duplicates(paragraphs, args.threshold, shingle_size=args.shingle_size)
+    if not clusters:
+        print(
+            f"[OK] No near-duplicate paragraphs found "
+            f"({len(paragraphs)} paragraphs, threshold {args.threshold})."
+        )
+        return 0
+
+    print(f"[NG] Near-duplicate paragraphs found (threshold {args.threshold}):")
+    for score, members in clusters:
+        print(f"  cluster (similarity {score:.2f}):")
+        for paragraph in members:
+            preview = " ".join(paragraph.text.split())[:60]
+            print(f"    - {paragraph.path.as_posix()}:{paragraph.start}-{paragraph.end}  {preview}")
+    print("Keep the procedure in one place and link to it from the others.")
+    return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
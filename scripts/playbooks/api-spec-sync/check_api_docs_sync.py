@@ -4,44 +4,911 @@
 from __future__ import annotations
 
 import argparse
+import ast
+import concurrent.futures
+import hashlib
+import json
+import os
 import pathlib
 import re
 import subprocess
 import sys
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass, field, replace
 
 DEFAULT_CODE_PATHS = ["src", "app", "backend", "server"]
+READ_CHUNK_BYTES = 64 * 1024
 
+# git status --porcelain=v2 の行種別ごとの、パスより前にある空白区切りフィールド数
+STATUS_V2_FIELDS = {"1": 8, "2": 9, "u": 10, "?": 1}
+# 種別 1 / 2 のフィールドのうち、HEAD 側の blob ID の位置
+STATUS_V2_HEAD_OID = 6
 
-def run_git(args: list[str]) -> str:
-    result = subprocess.run(
+HTTP_METHODS = ("get", "post", "put", "patch", "delete", "head", "options", "trace")
+MULTI_METHOD_DECORATORS = ("route", "api_route")
+# デコレータではなく呼び出しで登録する API と、ハンドラを渡す (キーワード, 位置引数の番号)
+ROUTE_REGISTRATION_CALLS = {"add_api_route": ("endpoint", 1), "add_url_rule": ("view_func", 2)}
+ROUTE_PATH_KEYWORDS = ("path", "rule")
+ROUTER_PREFIX_KEYWORDS = ("prefix", "url_prefix")
+ENDPOINT_HEADING_PATTERN = re.compile(r"#\s+([A-Z]+)\s+(\S+)")
+CHANGE_LABELS = {"added": "追加", "removed": "削除", "changed": "変更"}
+# 解析キャッシュは作業ツリーの変更に現れないよう .git 配下（git rev-parse --git-path）に置く
+CACHE_GIT_PATH = "api-docs-sync/routes.json"
+DEFAULT_CACHE_ENTRIES = 50_000
+
+
+def stream_git(args: list[str]) -> Iterator[str]:
+    """git の NUL 区切り出力を、全体を溜めずにフィールド単位で返す。"""
+    process = subprocess.Popen(
         ["git", *args],
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
-        text=True,
-        check=False,
     )
-    if result.returncode != 0:
-        raise RuntimeError(result.stderr.strip() or "git command failed")
-    return result.stdout
+    assert process.stdout is not None and process.stderr is not None
+    pending = b""
+    try:
+        while chunk := process.stdout.read(READ_CHUNK_BYTES):
+            fields = (pending + chunk).split(b"\0")
+            pending = fields.pop()
+            for entry in fields:
+                yield entry.decode("utf-8", errors="surrogateescape")
+        if pending:
+            yield pending.decode("utf-8", errors="surrogateescape")
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read().decode("utf-8", errors="replace")
+        process.stderr.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise RuntimeError(stderr.strip() or "git command failed")
 
 
-def has_ref(ref: str) -> bool:
-    result = subprocess.run(
-        ["git", "rev-parse", "--verify", "--quiet", ref],
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-        check=False,
-    )
-    return result.returncode == 0
+def blob_oid(oid: str) -> str | None:
+    # 全桁 0 の ID は「その側にファイルがない」ことを表す
+    return None if not oid or set(oid) == {"0"} else oid
+
+
+def parse_status_v2(fields: Iterator[str]) -> Iterator[tuple[str, str | None]]:
+    """git status --porcelain=v2 -z の出力から、(変更・未追跡のパス, HEAD 側の blob ID) を返す。
+
+    リネーム/コピー（種別 2）は移動先に続くフィールドの移動元も返す。
+    """
+    for record in fields:
+        kind = record[:1]
+        if kind not in STATUS_V2_FIELDS:
+            continue
+        parts = record.split(" ", STATUS_V2_FIELDS[kind])
+        head_oid = blob_oid(parts[STATUS_V2_HEAD_OID]) if kind in ("1", "2") else None
+        if kind == "2":
+            yield parts[-1], None
+            yield next(fields), head_oid
+        else:
+            yield parts[-1], head_oid
+
+
+def parse_diff_raw(fields: Iterator[str]) -> Iterator[tuple[str, str | None]]:
+    """git diff --raw -z --no-renames の出力から、(パス, 基準側の blob ID) を返す。"""
+    for record in fields:
+        if not record.startswith(":"):
+            continue
+        parts = record.split(" ")
+        yield next(fields), blob_oid(parts[2])
+
+
+@dataclass
+class CommitChanges:
+    """--range の 1 コミット分の変更。値はそれぞれ親側・コミット側の blob ID。"""
+
+    sha: str
+    subject: str
+    base_oids: dict[str, str | None] = field(default_factory=dict)
+    head_oids: dict[str, str | None] = field(default_factory=dict)
+
+
+def parse_log_raw(fields: Iterator[str]) -> Iterator[CommitChanges]:
+    """git log --raw -z --format=%x01%H %s の出力を、コミット単位に区切って返す。"""
+    commit: CommitChanges | None = None
+    for record in fields:
+        # raw 部の先頭レコードはヘッダ直後の改行から始まる
+        record = record.lstrip("\n")
+        if record.startswith("\x01"):
+            if commit is not None:
+                yield commit
+            sha, _, subject = record[1:].partition(" ")
+            commit = CommitChanges(sha, subject)
+        elif record.startswith(":") and commit is not None:
+            parts = record.split(" ")
+            path = str(pathlib.PurePosixPath(next(fields)))
+            commit.base_oids[path] = blob_oid(parts[2])
+            commit.head_oids[path] = blob_oid(parts[3])
+    if commit is not None:
+        yield commit
+
+
+class BlobReader:
+    """1 本の ``git cat-file --batch`` プロセスで blob の内容を読む。
+
+    複数スレッドから呼ばれても要求と応答が混ざらないようにロックする。
+    """
+
+    def __init__(self) -> None:
+        self.process = subprocess.Popen(
+            ["git", "cat-file", "--batch"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self.lock = threading.Lock()
+
+    def read(self, name: str) -> bytes | None:
+        assert self.process.stdin is not None and self.process.stdout is not None
+        with self.lock:
+            self.process.stdin.write(f"{name}\n".encode("utf-8"))
+            self.process.stdin.flush()
+            header = self.process.stdout.readline()
+            if not header:
+                raise RuntimeError("git cat-file --batch が応答しません")
+            fields = header.split()
+            if len(fields) != 3 or fields[1] != b"blob":
+                return None
+            return self.process.stdout.read(int(fields[2]) + 1)[:-1]
+
+    def close(self) -> None:
+        if self.process.stdin is not None:
+            self.process.stdin.close()
+        self.process.wait()
+        for stream in (self.process.stdout, self.process.stderr):
+            if stream is not None:
+                stream.close()
 
 
 def normalize(path: str) -> str:
     return str(pathlib.PurePosixPath(path.strip()))
 
 
-def is_under(path: str, root: str) -> bool:
-    root_norm = normalize(root).rstrip("/")
-    return path == root_norm or path.startswith(root_norm + "/")
+@dataclass(frozen=True)
+class PathRule:
+    """ルールファイル 1 行分。pattern に一致するコードの API ドキュメントは docs_root に置く。"""
+
+    pattern: str
+    docs_root: str
+    line: int
+
+
+def glob_prefix(pattern: str) -> list[str]:
+    """glob のうち、ワイルドカードを含まない先頭のディレクトリ部分をセグメントで返す。"""
+    segments = pattern.split("/")
+    prefix: list[str] = []
+    for segment in segments[:-1]:
+        if any(char in segment for char in "*?["):
+            break
+        prefix.append(segment)
+    return prefix
+
+
+def glob_regex(pattern: str) -> str:
+    """CODEOWNERS 風の glob を正規表現にする。一致したディレクトリの配下も一致とみなす。"""
+    regex = ""
+    segments = pattern.split("/")
+    for index, segment in enumerate(segments):
+        last = index == len(segments) - 1
+        if segment == "**":
+            regex += ".*" if last else "(?:[^/]+/)*"
+            continue
+        for char in segment:
+            if char == "*":
+                regex += "[^/]*"
+            elif char == "?":
+                regex += "[^/]"
+            else:
+                regex += re.escape(char)
+        if not last:
+            regex += "/"
+    return regex + "(?:/.*)?"
+
+
+def normalize_pattern(pattern: str) -> str:
+    """先頭 / はルート固定、/ を含まない glob は任意の階層に一致させる。末尾 / は配下すべて。"""
+    if pattern.endswith("/"):
+        pattern += "**"
+    if pattern.startswith("/"):
+        return pattern.lstrip("/")
+    if "/" not in pattern:
+        return f"**/{pattern}"
+    return pattern
+
+
+class RuleTrie:
+    """glob の固定部分のディレクトリで分岐するトライ。ノードごとに規則を結合した正規表現を持つ。"""
+
+    def __init__(self) -> None:
+        self.children: dict[str, RuleTrie] = {}
+        self.rules: list[int] = []
+        self.matcher: re.Pattern[str] | None = None
+
+
+class PathRules:
+    """コード glob から API ドキュメントルートを引く規則集。
+
+    CODEOWNERS と同じく、後に書いた規則ほど優先する。規則は 1 回だけコンパイルし、
+    パスを辿ってトライ上の候補ノードだけを見て、ノードごとの結合正規表現で照合する。
+    """
+
+    def __init__(self, rules: list[PathRule]) -> None:
+        self.rules = rules
+        self.docs_roots = {rule.docs_root for rule in rules}
+        self.root = RuleTrie()
+        regexes: list[str] = []
+        for index, rule in enumerate(rules):
+            pattern = normalize_pattern(rule.pattern)
+            regexes.append(glob_regex(pattern))
+            node = self.root
+            for segment in glob_prefix(pattern):
+                node = node.children.setdefault(segment, RuleTrie())
+            node.rules.append(index)
+        self.compile(self.root, regexes)
+
+    def compile(self, node: RuleTrie, regexes: list[str]) -> None:
+        # fullmatch では先に書いた選択肢が優先されるため、後の規則から並べる
+        if node.rules:
+            node.matcher = re.compile(
+                "|".join(f"(?P<r{index}>{regexes[index]})" for index in reversed(node.rules))
+            )
+        for child in node.children.values():
+            self.compile(child, regexes)
+
+    def match(self, path: str) -> PathRule | None:
+        best = -1
+        node: RuleTrie | None = self.root
+        segments = path.split("/")
+        for depth in range(len(segments)):
+            assert node is not None
+            if node.matcher is not None:
+                matched = node.matcher.fullmatch(path)
+                if matched is not None and matched.lastgroup is not None:
+                    best = max(best, int(matched.lastgroup[1:]))
+            node = node.children.get(segments[depth])
+            if node is None:
+                break
+        return self.rules[best] if best >= 0 else None
+
+    def docs_root_of(self, path: str) -> str | None:
+        parent = pathlib.PurePosixPath(path).parent
+        for ancestor in [parent, *parent.parents]:
+            if str(ancestor) in self.docs_roots:
+                return str(ancestor)
+        return None
+
+
+def load_rules(path: str) -> list[PathRule]:
+    rules: list[PathRule] = []
+    text = pathlib.Path(path).read_text(encoding="utf-8")
+    for number, line in enumerate(text.splitlines(), start=1):
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        fields = stripped.split()
+        if len(fields) != 2:
+            raise ValueError(
+                f"{path}:{number}: '<コードのglob> <APIドキュメントルート>' の形式で記述してください"
+            )
+        rules.append(PathRule(fields[0], normalize(fields[1]).rstrip("/"), number))
+    return rules
+
+
+def default_rules(code_paths: list[str], docs_root: str) -> list[PathRule]:
+    docs_root = normalize(docs_root).rstrip("/")
+    return [
+        PathRule("/" + normalize(code_path).strip("/"), docs_root, 0) for code_path in code_paths
+    ]
+
+
+@dataclass(frozen=True)
+class Route:
+    """route 宣言 1 件。signature はハンドラの引数・戻り値とデコレータのキーワード引数。"""
+
+    method: str
+    path: str
+    handler: str
+    signature: str
+    source: str
+
+
+@dataclass
+class EndpointChange:
+    """基準側と現在側で差があったエンドポイントと、更新が必要なドキュメント。"""
+
+    kind: str
+    route: Route
+    required: list[str]
+    missing: list[str] = field(default_factory=list)
+
+    def describe(self) -> str:
+        return (
+            f"{self.route.method} {self.route.path}"
+            f"（{CHANGE_LABELS[self.kind]}, {self.route.source}: {self.route.handler}）"
+        )
+
+
+def literal_str(node: ast.expr | None) -> str | None:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    return None
+
+
+def call_keyword(call: ast.Call, names: Iterable[str]) -> ast.expr | None:
+    for keyword in call.keywords:
+        if keyword.arg in names:
+            return keyword.value
+    return None
+
+
+def router_prefixes(tree: ast.Module) -> dict[str, str]:
+    # router = APIRouter(prefix="/users") / bp = Blueprint(..., url_prefix="/users") の prefix
+    prefixes: dict[str, str] = {}
+    for node in tree.body:
+        if not isinstance(node, ast.Assign) or not isinstance(node.value, ast.Call):
+            continue
+        prefix = literal_str(call_keyword(node.value, ROUTER_PREFIX_KEYWORDS))
+        if prefix is None:
+            continue
+        for target in node.targets:
+            if isinstance(target, ast.Name):
+                prefixes[target.id] = prefix.rstrip("/")
+    return prefixes
+
+
+def declared_routes(
+    call: ast.expr, prefixes: dict[str, str], names: Iterable[str]
+) -> list[tuple[str, str]]:
+    """``@app.get("/x")`` や ``app.add_url_rule("/x", ...)`` のうち names の呼び出しから (METHOD, PATH) を返す。"""
+    if not isinstance(call, ast.Call) or not isinstance(call.func, ast.Attribute):
+        return []
+    name = call.func.attr
+    if name not in names:
+        return []
+    path = literal_str(call.args[0]) if call.args else None
+    path = path if path is not None else literal_str(call_keyword(call, ROUTE_PATH_KEYWORDS))
+    if path is None:
+        return []
+    owner = call.func.value
+    prefix = prefixes.get(owner.id, "") if isinstance(owner, ast.Name) else ""
+    if name in HTTP_METHODS:
+        methods = [name.upper()]
+    else:
+        methods_node = call_keyword(call, ("methods",))
+        if isinstance(methods_node, (ast.List, ast.Tuple, ast.Set)):
+            methods = sorted(
+                value.upper() for value in map(literal_str, methods_node.elts) if value
+            )
+        else:
+            methods = ["GET"]
+    return [(method, prefix + path) for method in methods]
+
+
+def route_options(call: ast.Call, excluded: Iterable[str]) -> str:
+    excluded = {"methods", *ROUTE_PATH_KEYWORDS, *excluded}
+    return ", ".join(
+        f"{keyword.arg}={ast.unparse(keyword.value)}"
+        for keyword in sorted(call.keywords, key=lambda item: item.arg or "")
+        if keyword.arg not in excluded
+    )
+
+
+def function_signature(node: ast.FunctionDef | ast.AsyncFunctionDef) -> str:
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+    return f"({ast.unparse(node.args)}){returns}"
+
+
+def extract_routes(source: str, source_path: str) -> dict[tuple[str, str], Route]:
+    """Python モジュールから route 宣言を抽出する。構文エラーは SyntaxError のまま送出する。
+
+    デコレータのほか、``app.add_url_rule(...)`` / ``router.add_api_route(...)`` による登録も扱う。
+    """
+    if "@" not in source and not any(name in source for name in ROUTE_REGISTRATION_CALLS):
+        return {}
+    tree = ast.parse(source, filename=source_path)
+    prefixes = router_prefixes(tree)
+    routes: dict[tuple[str, str], Route] = {}
+    functions: dict[str, ast.FunctionDef | ast.AsyncFunctionDef] = {}
+    registrations: list[ast.Call] = []
+    decorator_names = (*HTTP_METHODS, *MULTI_METHOD_DECORATORS)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            if node.func.attr in ROUTE_REGISTRATION_CALLS:
+                registrations.append(node)
+            continue
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        functions.setdefault(node.name, node)
+        for decorator in node.decorator_list:
+            for method, path in declared_routes(decorator, prefixes, decorator_names):
+                assert isinstance(decorator, ast.Call)
+                signature = f"{function_signature(node)} [{route_options(decorator, ())}]"
+                routes[(method, path)] = Route(method, path, node.name, signature, source_path)
+    for call in registrations:
+        assert isinstance(call.func, ast.Attribute)
+        keyword, position = ROUTE_REGISTRATION_CALLS[call.func.attr]
+        handler_node = call_keyword(call, (keyword,))
+        if handler_node is None and len(call.args) > position:
+            handler_node = call.args[position]
+        function = functions.get(handler_node.id) if isinstance(handler_node, ast.Name) else None
+        if function is not None:
+            handler, parameters = function.name, function_signature(function)
+        else:
+            # クラスベースビュー（View.as_view(...)）など、定義を辿れないハンドラは式のまま比較する
+            handler = ast.unparse(handler_node) if handler_node is not None else ""
+            parameters = handler
+        signature = f"{parameters} [{route_options(call, (keyword,))}]"
+        for method, path in declared_routes(call, prefixes, ROUTE_REGISTRATION_CALLS):
+            routes[(method, path)] = Route(method, path, handler, signature, source_path)
+    return routes
+
+
+def git_blob_oid(data: bytes) -> str:
+    # git hash-object と同じ blob ID。作業ツリー側の内容をキャッシュのキーにする
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def resource_name(path: str) -> str:
+    segments = [
+        segment
+        for segment in path.strip("/").split("/")
+        if segment and segment[0] not in "{<:"
+    ]
+    return segments[-1] if segments else "root"
+
+
+def cache_version(api_pattern: str, rules_path: str | None) -> str:
+    # 抽出ロジック（このスクリプト）・ルールファイル・API判定パターンのどれかが変われば別のキーになる
+    hasher = hashlib.sha256(pathlib.Path(__file__).read_bytes())
+    hasher.update(api_pattern.encode("utf-8"))
+    if rules_path is not None:
+        hasher.update(pathlib.Path(rules_path).read_bytes())
+    return hasher.hexdigest()[:16]
+
+
+class RouteCache:
+    """blob ID ごとの route 抽出結果をディスクに保存する、件数上限付きの LRU キャッシュ。
+
+    キーは ``<ルール版>:<blob ID>``。JSON の並び順を古い順の利用履歴として使い、
+    保存時に max_entries を超えた分を古いものから捨てる。
+    """
+
+    def __init__(self, path: pathlib.Path, version: str, max_entries: int) -> None:
+        self.path = path
+        self.version = version
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        try:
+            loaded = json.loads(path.read_text(encoding="utf-8")).get("entries", {})
+        except (OSError, ValueError, AttributeError):
+            loaded = {}
+        self.entries: dict[str, dict] = loaded if isinstance(loaded, dict) else {}
+
+    def get(self, oid: str) -> dict | None:
+        key = f"{self.version}:{oid}"
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries[key] = entry
+            self.hits += 1
+            return entry
+
+    def put(self, oid: str, entry: dict) -> None:
+        with self.lock:
+            self.entries[f"{self.version}:{oid}"] = entry
+
+    def save(self) -> None:
+        with self.lock:
+            keys = list(self.entries)
+            for key in keys[: max(len(keys) - self.max_entries, 0)]:
+                del self.entries[key]
+            content = json.dumps({"entries": self.entries}, ensure_ascii=False)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_suffix(f".{os.getpid()}.tmp")
+        temporary.write_text(content, encoding="utf-8")
+        os.replace(temporary, self.path)
+
+
+class EndpointAnalyzer:
+    """変更された Python モジュールの route 宣言を基準側と現在側で抽出し、比較する。
+
+    抽出結果は blob ID ごとにキャッシュし（cache があればディスクにも保存し）、基準側の内容は
+    キャッシュにない blob だけ cat-file で読む。
+    """
+
+    def __init__(
+        self,
+        base_oids: dict[str, str | None],
+        root: pathlib.Path,
+        cache: RouteCache | None = None,
+        head_oids: dict[str, str | None] | None = None,
+    ) -> None:
+        self.base_oids = base_oids
+        # None なら現在側は作業ツリーから読む
+        self.head_oids = head_oids
+        self.root = root
+        self.cache = cache
+        self.routes_by_blob: dict[str, dict[tuple[str, str], Route]] = {}
+        self.docs_by_root: dict[str, dict[tuple[str, str], str]] = {}
+        self.reader: BlobReader | None = None
+        self.lock = threading.Lock()
+
+    def for_commit(self, commit: CommitChanges) -> EndpointAnalyzer:
+        """1 コミット分の解析器を返す。抽出結果・キャッシュ・cat-file プロセスは共有する。"""
+        analyzer = EndpointAnalyzer(commit.base_oids, self.root, self.cache, commit.head_oids)
+        analyzer.routes_by_blob = self.routes_by_blob
+        analyzer.docs_by_root = self.docs_by_root
+        analyzer.reader = self.blob_reader()
+        return analyzer
+
+    def blob_reader(self) -> BlobReader:
+        with self.lock:
+            if self.reader is None:
+                self.reader = BlobReader()
+            return self.reader
+
+    def endpoint_docs(self, docs_root: str) -> dict[tuple[str, str], str]:
+        docs = self.docs_by_root.get(docs_root)
+        if docs is None:
+            docs = endpoint_docs(self.root, docs_root)
+            self.docs_by_root[docs_root] = docs
+        return docs
+
+    def close(self) -> None:
+        if self.reader is not None:
+            self.reader.close()
+        if self.cache is not None:
+            self.cache.save()
+
+    def parse_blob(
+        self, oid: str, path: str, load: Callable[[], bytes | None]
+    ) -> dict[tuple[str, str], Route]:
+        entry = self.cache.get(oid) if self.cache is not None else None
+        if entry is not None:
+            if "error" in entry:
+                raise SyntaxError(entry["error"])
+            return {
+                (method, route_path): Route(method, route_path, handler, signature, path)
+                for method, route_path, handler, signature in entry["routes"]
+            }
+        data = load()
+        source = (data or b"").decode("utf-8", errors="replace")
+        try:
+            routes = extract_routes(source, path)
+        except SyntaxError as err:
+            if self.cache is not None:
+                self.cache.put(oid, {"error": str(err)})
+            raise
+        if self.cache is not None:
+            self.cache.put(
+                oid,
+                {
+                    "routes": [
+                        [route.method, route.path, route.handler, route.signature]
+                        for route in routes.values()
+                    ]
+                },
+            )
+        return routes
+
+    def routes_of(
+        self, oid: str, path: str, load: Callable[[], bytes | None]
+    ) -> dict[tuple[str, str], Route]:
+        cached = self.routes_by_blob.get(oid)
+        if cached is None:
+            cached = self.parse_blob(oid, path, load)
+            self.routes_by_blob[oid] = cached
+        # 同じ内容のファイルが別のパスにあっても、出典は呼び出し側のパスにする
+        return {
+            key: route if route.source == path else replace(route, source=path)
+            for key, route in cached.items()
+        }
+
+    def base_routes(self, path: str) -> dict[tuple[str, str], Route]:
+        oid = self.base_oids.get(path)
+        if oid is None:
+            return {}
+        reader = self.blob_reader()
+        return self.routes_of(oid, path, lambda: reader.read(oid))
+
+    def head_routes(self, path: str) -> dict[tuple[str, str], Route]:
+        if self.head_oids is not None:
+            oid = self.head_oids.get(path)
+            if oid is None:
+                return {}
+            reader = self.blob_reader()
+            return self.routes_of(oid, path, lambda: reader.read(oid))
+        try:
+            data = (self.root / path).read_bytes()
+        except (FileNotFoundError, IsADirectoryError):
+            return {}
+        return self.routes_of(git_blob_oid(data), path, lambda: data)
+
+    def compare(self, paths: list[str]) -> list[tuple[str, Route]]:
+        """paths 全体での route の追加・削除・変更を返す。ファイル間の移動は変更とみなさない。
+
+        構文エラーのファイルは SyntaxError を送出する。
+        """
+        base: dict[tuple[str, str], Route] = {}
+        head: dict[tuple[str, str], Route] = {}
+        for path in paths:
+            base.update(self.base_routes(path))
+            head.update(self.head_routes(path))
+        changes: list[tuple[str, Route]] = []
+        for key in sorted(base.keys() | head.keys()):
+            if key not in base:
+                changes.append(("added", head[key]))
+            elif key not in head:
+                changes.append(("removed", base[key]))
+            elif base[key].signature != head[key].signature:
+                changes.append(("changed", head[key]))
+        return changes
+
+
+def endpoint_docs(root: pathlib.Path, docs_root: str) -> dict[tuple[str, str], str]:
+    """docs_root 配下の詳細ドキュメントを、先頭見出し ``# <METHOD> <PATH>`` で引ける対応表にする。"""
+    docs: dict[tuple[str, str], str] = {}
+    for doc in sorted((root / docs_root).rglob("*.md")):
+        with doc.open(encoding="utf-8", errors="replace") as handle:
+            first_line = handle.readline().strip()
+        heading = ENDPOINT_HEADING_PATTERN.match(first_line)
+        if heading is not None:
+            docs[(heading.group(1), heading.group(2))] = doc.relative_to(root).as_posix()
+    return docs
+
+
+def required_docs(
+    kind: str, route: Route, docs_root: str, docs: dict[tuple[str, str], str]
+) -> list[str]:
+    # 追加: 詳細 + 一覧、削除: 一覧、変更: 詳細。詳細は見出しで探し、なければ命名規約で決める
+    endpoint_doc = docs.get((route.method, route.path)) or (
+        f"{docs_root}/{resource_name(route.path)}-{route.method.lower()}.md"
+    )
+    index_doc = f"{docs_root}/index.md"
+    if kind == "added":
+        return [endpoint_doc, index_doc]
+    if kind == "removed":
+        return [index_doc]
+    return [endpoint_doc]
+
+
+@dataclass
+class ServiceVerdict:
+    """APIドキュメントルート 1 つ分の判定材料。"""
+
+    docs_root: str
+    api_changed: list[str] = field(default_factory=list)
+    docs_changed: list[str] = field(default_factory=list)
+    endpoint_files: list[str] = field(default_factory=list)
+    endpoint_changes: list[EndpointChange] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        coarse_ok = not self.api_changed or bool(self.docs_changed)
+        return coarse_ok and not any(change.missing for change in self.endpoint_changes)
+
+
+def analyze_endpoints(
+    verdict: ServiceVerdict, analyzer: EndpointAnalyzer, api_regex: re.Pattern[str]
+) -> None:
+    # route を宣言するモジュールはエンドポイント単位で、宣言しないモジュールは従来の
+    # ファイル名ベースの判定（api_changed）で扱う
+    api_files: list[str] = []
+    for path in verdict.endpoint_files:
+        try:
+            base_routes = analyzer.base_routes(path)
+            head_routes = analyzer.head_routes(path)
+        except SyntaxError as err:
+            print(
+                f"[WARN] 構文解析に失敗したためファイル単位で判定します: {path}: {err}",
+                file=sys.stderr,
+            )
+            verdict.api_changed.append(path)
+            continue
+        if base_routes or head_routes:
+            api_files.append(path)
+        elif api_regex.search(path):
+            verdict.api_changed.append(path)
+    changes = analyzer.compare(api_files) if api_files else []
+    if not changes:
+        return
+    docs = analyzer.endpoint_docs(verdict.docs_root)
+    docs_changed = set(verdict.docs_changed)
+    for kind, route in changes:
+        required = required_docs(kind, route, verdict.docs_root, docs)
+        missing = [doc for doc in required if doc not in docs_changed]
+        verdict.endpoint_changes.append(EndpointChange(kind, route, required, missing))
+
+
+def evaluate(
+    changed: Iterable[str],
+    rules: PathRules,
+    api_regex: re.Pattern[str],
+    analyzer: EndpointAnalyzer | None = None,
+) -> dict[str, ServiceVerdict]:
+    # 変更パスを 1 回だけ走査し、全サービスの判定材料を同時に集める
+    verdicts = {
+        docs_root: ServiceVerdict(docs_root)
+        for docs_root in sorted(rules.docs_roots)
+    }
+    for path in changed:
+        docs_root = rules.docs_root_of(path)
+        if docs_root is not None:
+            if path.endswith(".md"):
+                verdicts[docs_root].docs_changed.append(path)
+            continue
+        rule = rules.match(path)
+        if rule is None:
+            continue
+        if analyzer is not None and path.endswith(".py"):
+            verdicts[rule.docs_root].endpoint_files.append(path)
+        elif api_regex.search(path):
+            verdicts[rule.docs_root].api_changed.append(path)
+    if analyzer is not None:
+        for verdict in verdicts.values():
+            if verdict.endpoint_files:
+                analyze_endpoints(verdict, analyzer, api_regex)
+    return verdicts
+
+
+def report_endpoints(verdict: ServiceVerdict) -> int:
+    if any(change.missing for change in verdict.endpoint_changes):
+        print("[NG] 変更されたエンドポイントのAPIドキュメント更新が不足しています。")
+        status = 1
+    else:
+        print("[OK] 変更されたエンドポイントのAPIドキュメント更新を確認しました。")
+        status = 0
+    print_endpoint_changes(verdict)
+    return status
+
+
+def print_endpoint_changes(verdict: ServiceVerdict, indent: str = "  ") -> None:
+    for change in verdict.endpoint_changes:
+        line = f"{indent}- {change.describe()}"
+        if change.missing:
+            line += f": 未更新 {', '.join(change.missing)}"
+        print(line)
+
+
+def report_single(verdict: ServiceVerdict) -> int:
+    status = report_endpoints(verdict) if verdict.endpoint_changes else 0
+    if not verdict.api_changed:
+        if not verdict.endpoint_changes:
+            print("[OK] API実装に該当する変更は検出されませんでした。")
+        return status
+
+    if verdict.docs_changed:
+        print("[OK] API実装変更とAPIドキュメント変更の両方を検出しました。")
+        print("[INFO] API実装変更:")
+        for p in verdict.api_changed:
+            print(f"  - {p}")
+        print("[INFO] APIドキュメント変更:")
+        for p in verdict.docs_changed:
+            print(f"  - {p}")
+        return status
+
+    print("[NG] API実装変更を検出しましたが、APIドキュメント更新が見つかりません。")
+    print("[INFO] API実装変更:")
+    for p in verdict.api_changed:
+        print(f"  - {p}")
+    print(f"[ACTION] {verdict.docs_root}/ 配下のMarkdownを更新してください。")
+    return 1
+
+
+def report_services(verdicts: dict[str, ServiceVerdict], verbose: bool) -> int:
+    failed = [verdict for verdict in verdicts.values() if not verdict.ok]
+    for verdict in verdicts.values():
+        has_api_changes = verdict.api_changed or verdict.endpoint_changes
+        if not has_api_changes and not (verbose and verdict.docs_changed):
+            continue
+        status = "OK" if verdict.ok else "NG"
+        endpoints = (
+            f"エンドポイント変更 {len(verdict.endpoint_changes)} 件 / "
+            if verdict.endpoint_changes
+            else ""
+        )
+        print(
+            f"[{status}] {verdict.docs_root}: API実装変更 {len(verdict.api_changed)} 件 / "
+            f"{endpoints}APIドキュメント変更 {len(verdict.docs_changed)} 件"
+        )
+        if verbose or not verdict.ok:
+            for p in verdict.api_changed:
+                print(f"  - {p}")
+            print_endpoint_changes(verdict)
+        if verbose:
+            for p in verdict.docs_changed:
+                print(f"  + {p}")
+    if not any(verdict.api_changed or verdict.endpoint_changes for verdict in verdicts.values()):
+        print("[OK] API実装に該当する変更は検出されませんでした。")
+        return 0
+    if failed:
+        print(f"[ACTION] APIドキュメント更新が見つからないサービスが {len(failed)} 件あります。")
+        for verdict in failed:
+            print(f"  - {verdict.docs_root}/ 配下のMarkdownを更新してください。")
+        return 1
+    return 0
+
+
+def report_range(
+    results: Iterable[tuple[CommitChanges, dict[str, ServiceVerdict]]], verbose: bool
+) -> int:
+    total = 0
+    failed = 0
+    for commit, verdicts in results:
+        total += 1
+        touched = [
+            verdict
+            for verdict in verdicts.values()
+            if verdict.api_changed or verdict.endpoint_changes
+        ]
+        broken = [verdict for verdict in touched if not verdict.ok]
+        if broken:
+            failed += 1
+        status = "NG" if broken else "OK"
+        summary = f"API変更のあるサービス {len(touched)} 件" if touched else "API実装変更なし"
+        print(f"[{status}] {commit.sha[:12]} {commit.subject} ({summary})")
+        for verdict in touched if verbose else broken:
+            endpoints = (
+                f"エンドポイント変更 {len(verdict.endpoint_changes)} 件 / "
+                if verdict.endpoint_changes
+                else ""
+            )
+            print(
+                f"  {verdict.docs_root}: API実装変更 {len(verdict.api_changed)} 件 / "
+                f"{endpoints}APIドキュメント変更 {len(verdict.docs_changed)} 件"
+            )
+            for p in verdict.api_changed:
+                print(f"    - {p}")
+            print_endpoint_changes(verdict, indent="    ")
+    if total == 0:
+        print("[OK] 範囲内に検査対象のコミットはありません。")
+        return 0
+    if failed:
+        print(f"[NG] APIドキュメント更新が不足しているコミットが {failed} 件あります（全 {total} 件）。")
+        return 1
+    print(f"[OK] 全 {total} 件のコミットでAPIドキュメントの更新漏れは見つかりませんでした。")
+    return 0
+
+
+def evaluate_range(
+    revision_range: str,
+    rules: PathRules,
+    api_regex: re.Pattern[str],
+    analyzer: EndpointAnalyzer | None,
+    jobs: int,
+) -> Iterator[tuple[CommitChanges, dict[str, ServiceVerdict]]]:
+    # コミット一覧と各コミットの変更ファイルは git log 1 回で取得し、読み進めながら
+    # 判定をワーカーに投入する。結果はコミット順（古い順）に返す。
+    fields = stream_git(
+        [
+            "log",
+            "--reverse",
+            "--no-merges",
+            "--raw",
+            "-z",
+            "--no-renames",
+            "--no-abbrev",
+            "--format=%x01%H %s",
+            revision_range,
+            "--",
+        ]
+    )
+
+    def judge(commit: CommitChanges) -> dict[str, ServiceVerdict]:
+        commit_analyzer = analyzer.for_commit(commit) if analyzer is not None else None
+        return evaluate(list(commit.head_oids), rules, api_regex, commit_analyzer)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [(commit, pool.submit(judge, commit)) for commit in parse_log_raw(fields)]
+        for commit, future in futures:
+            yield commit, future.result()
 
 
 def parse_args() -> argparse.Namespace:
@@ -50,14 +917,34 @@ def parse_args() -> argparse.Namespace:
     )
     parser.add_argument(
         "--docs-root",
-        required=True,
-        help="APIドキュメントのルートディレクトリ（例: docs/api）",
+        help="APIドキュメントのルートディレクトリ（例: docs/api）。--rules 未指定時は必須",
+    )
+    parser.add_argument(
+        "--rules",
+        help=(
+            "コードの glob と APIドキュメントルートの対応表（CODEOWNERS 形式、後の行ほど優先）。"
+            "指定時はサービス（ドキュメントルート）ごとに判定する"
+        ),
     )
     parser.add_argument(
         "--base-ref",
         default="HEAD",
         help="差分比較の基準ref（既定: HEAD）",
     )
+    parser.add_argument(
+        "--range",
+        metavar="BASE..HEAD",
+        help=(
+            "作業ツリーの差分の代わりに、範囲内の各コミット（マージコミットを除く）を"
+            "親との差分で個別に判定する。--base-ref は使わない"
+        ),
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="--range の判定を並列に行うワーカー数（既定: CPU 数）",
+    )
     parser.add_argument(
         "--code-path",
         action="append",
@@ -69,97 +956,140 @@ def parse_args() -> argparse.Namespace:
         default=r"(route|router|handler|controller|endpoint|openapi|swagger|dto|schema|api)",
         help="API実装とみなすファイル名/パスの正規表現",
     )
+    parser.add_argument(
+        "--endpoints",
+        action="store_true",
+        help=(
+            "変更された Python モジュールの route 宣言（メソッド・パス・ハンドラのシグネチャ）を"
+            "基準側と比較し、エンドポイントごとに詳細ドキュメント/一覧の更新を要求する"
+        ),
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=f"--endpoints の解析結果キャッシュ（.git/{CACHE_GIT_PATH}）を使わない",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_CACHE_ENTRIES,
+        help=f"解析結果キャッシュに残す blob の最大件数（古い順に破棄、既定: {DEFAULT_CACHE_ENTRIES}）",
+    )
     parser.add_argument(
         "--verbose",
         action="store_true",
         help="判定対象ファイルを詳細表示する",
     )
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.rules is None and args.docs_root is None:
+        parser.error("--docs-root か --rules のどちらかを指定してください")
+    if args.range is not None and ".." not in args.range:
+        parser.error("--range は BASE..HEAD の形式で指定してください")
+    if args.jobs < 1:
+        parser.error("--jobs は 1 以上を指定してください")
+    return args
+
 
+def collect_changes(base_ref: str) -> dict[str, str | None]:
+    # HEAD 基準ならステージ済み・未ステージ・未追跡を git status 1 回で、
+    # それ以外は git diff 1 回で集める。パスは NUL 区切りのまま逐次解析する。
+    # 値は基準側の blob ID（基準側にファイルがなければ None）。
+    if base_ref == "HEAD":
+        entries = parse_status_v2(
+            stream_git(["status", "--porcelain=v2", "-z", "--untracked-files=all"])
+        )
+    else:
+        entries = parse_diff_raw(
+            stream_git(["diff", "--raw", "-z", "--no-renames", "--no-abbrev", base_ref, "--"])
+        )
+    changes = {str(pathlib.PurePosixPath(path)): oid for path, oid in entries if path}
+    return dict(sorted(changes.items()))
 
-def collect_changed_files(base_ref: str) -> list[str]:
-    changed: set[str] = set()
 
-    if has_ref(base_ref):
-        output = run_git(["diff", "--name-only", base_ref, "--"])
-        changed.update(normalize(line) for line in output.splitlines() if line.strip())
-        if base_ref == "HEAD":
-            untracked = run_git(["ls-files", "--others", "--exclude-standard"])
-            changed.update(normalize(line) for line in untracked.splitlines() if line.strip())
-        return sorted(changed)
+def create_analyzer(
+    args: argparse.Namespace, base_oids: dict[str, str | None]
+) -> EndpointAnalyzer:
+    output = subprocess.run(
+        ["git", "rev-parse", "--show-toplevel", "--git-path", CACHE_GIT_PATH],
+        stdout=subprocess.PIPE,
+        text=True,
+        check=False,
+    ).stdout.splitlines()
+    root = pathlib.Path(output[0] if output else ".")
+    cache = None
+    if not args.no_cache and len(output) == 2:
+        version = cache_version(args.api_pattern, args.rules)
+        cache = RouteCache(pathlib.Path(output[1]), version, args.cache_size)
+    return EndpointAnalyzer(base_oids, root, cache)
 
-    if base_ref != "HEAD":
-        raise RuntimeError(f"指定されたrefが見つかりません: {base_ref}")
 
-    unstaged = run_git(["diff", "--name-only", "--"])
-    staged = run_git(["diff", "--name-only", "--cached", "--"])
-    untracked = run_git(["ls-files", "--others", "--exclude-standard"])
-    merged = "\n".join([unstaged, staged, untracked])
-    changed.update(normalize(line) for line in merged.splitlines() if line.strip())
-    return sorted(changed)
+def print_cache_stats(analyzer: EndpointAnalyzer | None) -> None:
+    if analyzer is not None and analyzer.cache is not None:
+        print(
+            f"[INFO] 解析キャッシュ: ヒット {analyzer.cache.hits} 件 / "
+            f"新規解析 {analyzer.cache.misses} 件"
+        )
 
 
 def main() -> int:
     args = parse_args()
 
-    try:
-        inside = run_git(["rev-parse", "--is-inside-work-tree"]).strip()
-    except RuntimeError as err:
-        print(f"[ERROR] git実行に失敗: {err}", file=sys.stderr)
-        return 2
+    api_regex = re.compile(args.api_pattern, flags=re.IGNORECASE)
+    if args.rules is not None:
+        try:
+            rules = PathRules(load_rules(args.rules))
+        except (OSError, ValueError) as err:
+            print(f"[ERROR] ルールファイルの読み込みに失敗: {err}", file=sys.stderr)
+            return 2
+    else:
+        rules = PathRules(default_rules(args.code_path or DEFAULT_CODE_PATHS, args.docs_root))
 
-    if inside != "true":
-        print("[ERROR] gitリポジトリ内で実行してください", file=sys.stderr)
-        return 2
+    if args.range is not None:
+        analyzer = create_analyzer(args, {}) if args.endpoints else None
+        try:
+            status = report_range(
+                evaluate_range(args.range, rules, api_regex, analyzer, args.jobs),
+                args.verbose,
+            )
+        except RuntimeError as err:
+            print(f"[ERROR] コミットの取得に失敗: {err}", file=sys.stderr)
+            return 2
+        finally:
+            if analyzer is not None:
+                analyzer.close()
+        if args.verbose:
+            print_cache_stats(analyzer)
+        return status
 
     try:
-        changed = collect_changed_files(args.base_ref)
+        changes = collect_changes(args.base_ref)
     except RuntimeError as err:
         print(f"[ERROR] 差分取得に失敗: {err}", file=sys.stderr)
         return 2
+    changed = list(changes)
     if not changed:
         print("[OK] 変更差分はありません。")
         return 0
 
-    api_regex = re.compile(args.api_pattern, flags=re.IGNORECASE)
-    code_paths = args.code_path or DEFAULT_CODE_PATHS
-    code_roots = [normalize(p).rstrip("/") for p in code_paths]
-    docs_root = normalize(args.docs_root).rstrip("/")
-
-    docs_changed = [p for p in changed if is_under(p, docs_root) and p.endswith(".md")]
-
-    api_impl_changed: list[str] = []
-    for path in changed:
-        if not any(is_under(path, root) for root in code_roots):
-            continue
-        if api_regex.search(path):
-            api_impl_changed.append(path)
+    analyzer = create_analyzer(args, changes) if args.endpoints else None
+    try:
+        verdicts = evaluate(changed, rules, api_regex, analyzer)
+    except RuntimeError as err:
+        print(f"[ERROR] 基準側の内容の取得に失敗: {err}", file=sys.stderr)
+        return 2
+    finally:
+        if analyzer is not None:
+            analyzer.close()
 
     if args.verbose:
         print("[INFO] changed files:")
         for p in changed:
             print(f"  - {p}")
+        print_cache_stats(analyzer)
 
-    if not api_impl_changed:
-        print("[OK] API実装に該当する変更は検出されませんでした。")
-        return 0
-
-    if docs_changed:
-        print("[OK] API実装変更とAPIドキュメント変更の両方を検出しました。")
-        print("[INFO] API実装変更:")
-        for p in api_impl_changed:
-            print(f"  - {p}")
-        print("[INFO] APIドキュメント変更:")
-        for p in docs_changed:
-            print(f"  - {p}")
-        return 0
-
-    print("[NG] API実装変更を検出しましたが、APIドキュメント更新が見つかりません。")
-    print("[INFO] API実装変更:")
-    for p in api_impl_changed:
-        print(f"  - {p}")
-    print(f"[ACTION] {docs_root}/ 配下のMarkdownを更新してください。")
-    return 1
+    if args.rules is None:
+        return report_single(verdicts[normalize(args.docs_root).rstrip("/")])
+    return report_services(verdicts, args.verbose)
 
 
 if __name__ == "__main__":
@@ -4,8 +4,25 @@
 from __future__ import annotations
 
 import argparse
+import fnmatch
+import functools
+import hashlib
+import io
+import json
 import re
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from collections.abc import Callable, Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import TypeVar
 
 CANONICAL_FILES = {
     "global": Path("docs/ai/canonical/global-policies.md"),
@@ -18,61 +35,832 @@ OUTPUT_FILES = {
     "cursor_global": Path(".cursor/rules/00-global.mdc"),
     "cursor_routing": Path(".cursor/rules/10-task-routing.mdc"),
     "cursor_playbooks": Path(".cursor/rules/20-playbooks.mdc"),
+    "claude": Path("CLAUDE.md"),
+    "copilot": Path(".github/copilot-instructions.md"),
+    "playbook_index": Path("docs/ai/playbooks/index.json"),
 }
 
+CANONICAL_DIR = Path("docs/ai/canonical")
 PLAYBOOK_CANONICAL_DIR = Path("docs/ai/canonical/playbooks")
 PLAYBOOK_OUTPUT_DIR = Path("docs/ai/playbooks")
+PLAYBOOK_ASSETS_DIR = Path("docs/ai/playbook-assets")
+INCLUDE_PATTERN = re.compile(r"\s*\{\{\s*include:\s*(.+?)\s*\}\}\s*")
+ROUTING_TABLE_PLACEHOLDER_PATTERN = re.compile(r"\s*\{\{\s*routing-table\s*\}\}\s*")
+ROUTING_TABLE_HEADER = ("| 判断ケース | この条件なら使う | 参照先Playbook |", "| --- | --- | --- |")
+PLAYBOOK_INDEX_KEYS = ("labels", "triggers", "scopes")
+CURSOR_RULES_DIR = Path(".cursor/rules")
+CURSOR_SECTION_RULE_PREFIX = "30-"
+CURSOR_SECTION_ATTRS = ("globs", "description", "apply", "rule")
+CURSOR_APPLY_MODES = ("always", "auto", "agent", "manual")
 
 AUTO_GENERATED_NOTICE = "<!-- AUTO-GENERATED FILE. DO NOT EDIT DIRECTLY. -->\n"
-FRONTMATTER_PATTERN = re.compile(r"\A---\n.*?\n---\n?", re.DOTALL)
+MARKDOWN_HEADING_PATTERN = re.compile(r"(#{1,6})\s+(.*?)\s*#*\s*$")
+MARKDOWN_BULLET_PATTERN = re.compile(r"[-*+]\s+")
+MARKDOWN_ORDERED_ITEM_PATTERN = re.compile(r"\d+[.)]\s+")
+DIRECTIVE_PATTERN = re.compile(r"<!--\s*ai-context:(.*?)-->")
+DIRECTIVE_ATTRIBUTE_PATTERN = re.compile(r"([A-Za-z_][\w-]*)=(?:\"([^\"]*)\"|(\S+))")
+AGENTS_SECTIONS = (
+    ("global", "1. グローバルポリシー"),
+    ("routing", "2. タスクルーティング"),
+    ("coding", "3. コーディング標準"),
+)
 AGENTS_WARN_BYTES = 8 * 1024
 AGENTS_HARD_LIMIT_BYTES = 32 * 1024
 ROUTING_BULLET_PLAYBOOK_PATTERN = re.compile(r"-\s*(.+?)\s*:\s*`([a-z0-9-]+)`")
 ROUTING_TABLE_PLAYBOOK_LINK_PATTERN = re.compile(
     r"\[([^\]]+)\]\((?:\./)?docs/ai/playbooks/([a-z0-9-]+)\.md(?:#[^)]+)?\)"
 )
+TABLE_SEPARATOR_CELL_PATTERN = re.compile(r":?-+:?")
 ROUTING_TABLE_HEADER_LABELS = {"判断ケース", "ケース", "タスク", "---"}
 
+# 生成結果の形式（frontmatter・見出し・並び順など）を変えるときは必ず上げる。
+# --header-only はこの値と入力ダイジェストだけで判定するため、上げ忘れると古い形式の生成物を見逃す。
+GENERATOR_VERSION = "3"
+# manifest は作業ツリーを汚さないよう git 管理下では .git 配下（git rev-parse --git-path）に置く
+MANIFEST_GIT_PATH = "ai-context-sync/manifest.json"
+MANIFEST_PATH = Path(".cache/ai-context-sync/manifest.json")
+SERVER_SOCKET_PATH = Path(".cache/ai-context-sync/server.sock")
+SERVER_UNSUPPORTED_OPTIONS = (
+    "watch",
+    "serve",
+    "fleet_root",
+    "fleet_list",
+    "profile",
+    "profile_trace",
+)
+INPUT_DIGEST_PATTERN = re.compile(r"<!-- inputs-sha256: ([0-9a-f]{64}) generator: (\S+) -->")
+HEADER_SCAN_BYTES = 16 * 1024
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z]+|[0-9]+|\n+|[^\sA-Za-z0-9]")
+TOKEN_BUDGET_TARGETS = (
+    "AGENTS.md",
+    "*/AGENTS.md",
+    ".cursor/rules/*.mdc",
+    "CLAUDE.md",
+    ".github/copilot-instructions.md",
+)
+DEFAULT_TOKEN_BUDGETS: dict[str, dict] = {
+    "AGENTS.md": {"total": 6000, "max_section_share": 0.6},
+    "CLAUDE.md": {"total": 6000, "max_section_share": 0.6},
+    ".github/copilot-instructions.md": {"total": 6000, "max_section_share": 0.6},
+    "*/AGENTS.md": {"total": 3000, "max_section_share": 0.8},
+    ".cursor/rules/*.mdc": {"total": 4000, "max_section_share": 0.8},
+}
+
+T = TypeVar("T")
+R = TypeVar("R")
+TextReader = Callable[[Path], str]
 
-def auto_header(source: str) -> str:
-    """生成ファイル向けヘッダを返す。"""
-    return AUTO_GENERATED_NOTICE + f"<!-- source: {source} + scripts/sync_ai_context.py -->\n"
+_FLEET_STATE: dict[str, dict] = {}
 
 
-def strip_first_heading(markdown: str) -> str:
-    """先頭見出しを除去して本文だけを返す。"""
-    lines = markdown.strip().splitlines()
+@dataclass
+class FleetResult:
+    """fleet モードでの 1 リポジトリ分の同期結果。"""
+
+    root: str
+    changed: list[str] = field(default_factory=list)
+    drift: list[str] = field(default_factory=list)
+    error: str | None = None
+
+
+class Profiler:
+    """フェーズ・ファイル単位の所要時間、入出力バイト数、ピークメモリを記録する。
+
+    無効時の span はほぼコストなしで何も記録しない。ピークメモリは tracemalloc で
+    メインスレッドの span だけ計測する（ワーカースレッドの割り当ては親フェーズに含まれる）。
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.records: list[dict] = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stack: list[dict] = []
+
+    def enable(self) -> None:
+        """計測を開始する。"""
+        self.enabled = True
+        self.records = []
+        self._origin = time.perf_counter()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def span(self, name: str, category: str = "phase") -> Iterator[dict]:
+        """name の区間を計測する。yield した dict に bytes_read 等を加算できる。"""
+        record: dict = {"name": name, "category": category, "bytes_read": 0, "bytes_written": 0}
+        if not self.enabled:
+            yield record
+            return
+        on_main = threading.current_thread() is threading.main_thread()
+        if on_main:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1]["_peak"] = max(self._stack[-1]["_peak"], peak)
+            tracemalloc.reset_peak()
+            record["_peak"] = current
+            self._stack.append(record)
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            finished = time.perf_counter()
+            record["start_ms"] = round((started - self._origin) * 1000, 3)
+            record["wall_ms"] = round((finished - started) * 1000, 3)
+            record["thread"] = threading.get_ident()
+            if on_main:
+                peak = max(record.pop("_peak"), tracemalloc.get_traced_memory()[1])
+                record["peak_memory_bytes"] = peak
+                self._stack.pop()
+                if self._stack:
+                    self._stack[-1]["_peak"] = max(self._stack[-1]["_peak"], peak)
+            else:
+                record["peak_memory_bytes"] = None
+            with self._lock:
+                self.records.append(record)
+
+    def count(self, record: dict, key: str, content: str | bytes | None) -> None:
+        """計測が有効なときだけ content のバイト数を record[key] に加算する。"""
+        if not self.enabled or content is None:
+            return
+        data = content.encode("utf-8") if isinstance(content, str) else content
+        record[key] += len(data)
+
+    def report(self) -> dict:
+        """フェーズ単位・ファイル単位に分けた計測結果を返す。"""
+        ordered = sorted(self.records, key=lambda record: record["start_ms"])
+        fields = ("name", "wall_ms", "bytes_read", "bytes_written", "peak_memory_bytes")
+        files = [
+            {"operation": record["category"], **{key: record[key] for key in fields}}
+            for record in ordered
+            if record["category"] != "phase"
+        ]
+        phases = []
+        for record in ordered:
+            if record["category"] != "phase":
+                continue
+            phase = {key: record[key] for key in fields}
+            end_ms = record["start_ms"] + record["wall_ms"]
+            for child in ordered:
+                if child["category"] == "phase":
+                    continue
+                if record["start_ms"] <= child["start_ms"] <= end_ms:
+                    phase["bytes_read"] += child["bytes_read"]
+                    phase["bytes_written"] += child["bytes_written"]
+            phases.append(phase)
+        total_ms = round((time.perf_counter() - self._origin) * 1000, 3)
+        return {"total_ms": total_ms, "phases": phases, "files": files}
+
+    def chrome_trace(self) -> dict:
+        """chrome://tracing / Perfetto で読める Trace Event 形式を返す。"""
+        events = []
+        for record in self.records:
+            events.append(
+                {
+                    "name": record["name"],
+                    "cat": record["category"],
+                    "ph": "X",
+                    "ts": round(record["start_ms"] * 1000),
+                    "dur": round(record["wall_ms"] * 1000),
+                    "pid": 1,
+                    "tid": record["thread"],
+                    "args": {
+                        "bytes_read": record["bytes_read"],
+                        "bytes_written": record["bytes_written"],
+                        "peak_memory_bytes": record["peak_memory_bytes"],
+                    },
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+PROFILER = Profiler()
+
+
+@dataclass
+class MarkdownHeading:
+    """見出し 1 件。line は 0 始まりの行番号。"""
+
+    level: int
+    text: str
+    line: int
+
+
+@dataclass
+class MarkdownTableRow:
+    """表の 1 行。区切り行も含めてそのまま保持する。"""
+
+    raw: str
+    cells: list[str]
+    line: int
+
+
+@dataclass
+class MarkdownBullet:
+    """箇条書き 1 件。raw は前後空白を除いた行全体。"""
+
+    raw: str
+    text: str
+    line: int
+
+
+@dataclass
+class MarkdownDirective:
+    """``<!-- ai-context: key=value ... -->`` 形式のセクション属性 1 件。"""
+
+    attrs: dict[str, str]
+    line: int
+
+
+@dataclass
+class MarkdownSection:
+    """属性付きセクション。lines[start:end] が見出し行を含む範囲。"""
+
+    attrs: dict[str, str]
+    heading: MarkdownHeading | None
+    start: int
+    end: int
+
+
+@dataclass
+class MarkdownDocument:
+    """1 回の走査で得た markdown の構造。各ヘルパはこれを共有して使う。"""
+
+    text: str
+    frontmatter: str | None
+    content: str
+    body: str
+    headings: list[MarkdownHeading] = field(default_factory=list)
+    table_rows: list[MarkdownTableRow] = field(default_factory=list)
+    bullets: list[MarkdownBullet] = field(default_factory=list)
+    directives: list[MarkdownDirective] = field(default_factory=list)
+    lines: list[str] = field(default_factory=list)
+    includes: dict[Path, list[Path]] = field(default_factory=dict)
+    include_hashes: dict[Path, str] = field(default_factory=dict)
+
+
+def parse_markdown(text: str) -> MarkdownDocument:
+    """markdown を 1 回の線形走査で frontmatter・見出し・表・箇条書きに分解する。
+
+    frontmatter は先頭行が ``---`` のときだけ認識し、content には frontmatter を除いた
+    本文を、body には先頭見出しを除いた本文を入れる（コードフェンス内は解析しない）。
+    ``<!-- ai-context: ... -->`` だけの行はセクション属性として directives に入れ、
+    content / body からは除く。
+    """
+    lines = text.strip().splitlines()
+    frontmatter_end = -1
+    in_frontmatter = bool(lines) and lines[0] == "---"
+    in_fence = False
+    headings: list[MarkdownHeading] = []
+    table_rows: list[MarkdownTableRow] = []
+    bullets: list[MarkdownBullet] = []
+    directives: list[MarkdownDirective] = []
+
+    for index, line in enumerate(lines):
+        if in_frontmatter:
+            if index > 0 and line.startswith("---"):
+                in_frontmatter = False
+                frontmatter_end = index
+            continue
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            in_fence = not in_fence
+            continue
+        if in_fence or not stripped:
+            continue
+        if stripped.startswith("<!--"):
+            directive = DIRECTIVE_PATTERN.fullmatch(stripped)
+            if directive is not None:
+                directives.append(MarkdownDirective(parse_directive(directive.group(1)), index))
+        elif stripped.startswith("#"):
+            heading = MARKDOWN_HEADING_PATTERN.match(stripped)
+            if heading is not None:
+                headings.append(MarkdownHeading(len(heading.group(1)), heading.group(2), index))
+        elif stripped.startswith("|"):
+            cells = [cell.strip() for cell in stripped.strip("|").split("|")]
+            table_rows.append(MarkdownTableRow(stripped, cells, index))
+        else:
+            bullet = MARKDOWN_BULLET_PATTERN.match(stripped)
+            if bullet is not None:
+                bullets.append(MarkdownBullet(stripped, stripped[bullet.end() :], index))
+
+    directive_lines = hidden_lines(lines, directives)
+    visible = [line for index, line in enumerate(lines) if index not in directive_lines]
+    if frontmatter_end >= 0:
+        frontmatter: str | None = "\n".join(lines[: frontmatter_end + 1]) + "\n"
+        content = "\n".join(visible[frontmatter_end + 1 :]).strip()
+    else:
+        frontmatter = None
+        content = "\n".join(visible).strip()
     if lines and lines[0].startswith("#"):
-        return "\n".join(lines[1:]).strip()
-    return "\n".join(lines).strip()
+        body = "\n".join(visible[1:]).strip()
+    else:
+        body = "\n".join(visible).strip()
+    return MarkdownDocument(
+        text=text,
+        frontmatter=frontmatter,
+        content=content,
+        body=body,
+        headings=headings,
+        table_rows=table_rows,
+        bullets=bullets,
+        directives=directives,
+        lines=lines,
+    )
 
 
-def read_canonical(root: Path) -> dict[str, str]:
-    """canonical ファイルを読み込む。"""
-    contents: dict[str, str] = {}
-    for key, rel_path in CANONICAL_FILES.items():
-        path = root / rel_path
-        if not path.exists():
-            raise FileNotFoundError(f"missing canonical file: {path}")
-        contents[key] = path.read_text(encoding="utf-8")
-    return contents
+def hidden_lines(lines: list[str], directives: list[MarkdownDirective]) -> set[int]:
+    """出力に含めない行番号を返す。属性行と、属性行の除去で重複する空行が対象。"""
+    hidden: set[int] = set()
+    for directive in directives:
+        index = directive.line
+        hidden.add(index)
+        previous_blank = index == 0 or not lines[index - 1].strip()
+        if previous_blank and index + 1 < len(lines) and not lines[index + 1].strip():
+            hidden.add(index + 1)
+    return hidden
+
+
+def parse_directive(source: str) -> dict[str, str]:
+    """``key=value key="a b"`` 形式の属性を辞書にする。"""
+    return {
+        match.group(1): match.group(2) if match.group(2) is not None else match.group(3)
+        for match in DIRECTIVE_ATTRIBUTE_PATTERN.finditer(source)
+    }
+
+
+def annotated_sections(document: MarkdownDocument) -> list[MarkdownSection]:
+    """属性が付いたセクションを返す。
+
+    属性は直前の見出しのセクション（次の同位以上の見出しまで）に掛かる。見出しより前に
+    書いた属性、または先頭見出しに付けた属性は文書全体に掛かる。
+    """
+    sections: list[MarkdownSection] = []
+    for directive in document.directives:
+        owner = None
+        for heading in document.headings:
+            if heading.line > directive.line:
+                break
+            owner = heading
+        if owner is None or owner.line == 0:
+            sections.append(MarkdownSection(directive.attrs, owner, 0, len(document.lines)))
+            continue
+        end = len(document.lines)
+        for heading in document.headings:
+            if heading.line > owner.line and heading.level <= owner.level:
+                end = heading.line
+                break
+        sections.append(MarkdownSection(directive.attrs, owner, owner.line, end))
+    return sections
+
+
+def section_text(document: MarkdownDocument, section: MarkdownSection) -> str:
+    """セクション本文を返す。文書全体に掛かる場合は先頭見出しを除いた本文を返す。"""
+    if section.start == 0:
+        return document.body
+    directive_lines = hidden_lines(document.lines, document.directives)
+    return "\n".join(
+        line
+        for index, line in enumerate(document.lines[section.start : section.end], section.start)
+        if index not in directive_lines
+    ).strip()
+
+
+def split_scopes(value: str) -> list[str]:
+    """scope 属性（カンマ区切り）を正規化したディレクトリ一覧にする。ルートは除く。"""
+    scopes: list[str] = []
+    for item in value.split(","):
+        scope = item.strip().removeprefix("./").strip("/")
+        if scope and scope != "." and scope not in scopes:
+            scopes.append(scope)
+    return scopes
+
+
+def section_scopes(section: MarkdownSection) -> list[str]:
+    """セクションの scope 属性を返す。"""
+    return split_scopes(section.attrs.get("scope", ""))
+
+
+def body_without(
+    document: MarkdownDocument, predicate: Callable[[MarkdownSection], bool]
+) -> str:
+    """predicate に該当するセクションを除いた本文（先頭見出しなし）を返す。"""
+    scoped = [section for section in annotated_sections(document) if predicate(section)]
+    if not scoped:
+        return document.body
+    if any(section.start == 0 for section in scoped):
+        return ""
+    excluded = {index for section in scoped for index in range(section.start, section.end)}
+    excluded.update(hidden_lines(document.lines, document.directives))
+    if document.lines and document.lines[0].startswith("#"):
+        excluded.add(0)
+    return "\n".join(
+        line for index, line in enumerate(document.lines) if index not in excluded
+    ).strip()
+
+
+def unscoped_body(document: MarkdownDocument) -> str:
+    """scope 付きセクションを除いた本文（先頭見出しなし）を返す。"""
+    return body_without(document, lambda section: bool(section_scopes(section)))
+
+
+def is_cursor_section(section: MarkdownSection) -> bool:
+    """常時適用の Cursor rule から切り出して個別の rule にするセクションか判定する。"""
+    return bool(section_scopes(section)) or any(
+        attr in section.attrs for attr in CURSOR_SECTION_ATTRS
+    )
+
+
+def cursor_always_body(document: MarkdownDocument) -> str:
+    """個別 rule に切り出すセクションを除いた、常時適用 rule 用の本文を返す。"""
+    return body_without(document, is_cursor_section)
+
+
+@dataclass
+class CursorSectionRule:
+    """canonical のセクション属性から生成する個別の Cursor rule。"""
+
+    name: str
+    path: Path
+    description: str
+    globs: list[str]
+    apply: str
+    sources: list[str] = field(default_factory=list)
+    bodies: list[str] = field(default_factory=list)
+
+
+def slugify(text: str) -> str:
+    """英数字とハイフンだけの名前にする。"""
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+
+
+def cursor_section_rules(
+    canonical: dict[str, MarkdownDocument], output_names: tuple[str, ...]
+) -> dict[Path, CursorSectionRule]:
+    """globs / description / apply / rule / scope 属性を持つセクションを Cursor rule にまとめる。
+
+    同じ rule 名のセクションは 1 ファイルに連結する。scope だけが指定されたセクションは
+    ``<scope>/**`` を globs とする。apply 省略時は globs があれば auto、description が
+    あれば agent、どちらもなければ manual とする。
+    """
+    rules: dict[Path, CursorSectionRule] = {}
+    for target_name in ("cursor_global", "cursor_routing"):
+        if target_name not in output_names:
+            continue
+        for key in OUTPUT_TARGETS[target_name].canonical_keys:
+            document = canonical.get(key)
+            if document is None:
+                continue
+            for index, section in enumerate(annotated_sections(document), start=1):
+                if not is_cursor_section(section):
+                    continue
+                heading_text = section.heading.text if section.heading else ""
+                name = slugify(section.attrs.get("rule", "")) or slugify(heading_text)
+                name = name or f"{key}-section-{index}"
+                path = CURSOR_RULES_DIR / f"{CURSOR_SECTION_RULE_PREFIX}{name}.mdc"
+                globs = [
+                    glob.strip() for glob in section.attrs.get("globs", "").split(",") if glob.strip()
+                ]
+                globs.extend(f"{scope}/**" for scope in section_scopes(section))
+                rule = rules.get(path)
+                if rule is None:
+                    description = section.attrs.get("description", "")
+                    apply = section.attrs.get("apply") or (
+                        "auto" if globs else "agent" if description else "manual"
+                    )
+                    if apply not in CURSOR_APPLY_MODES:
+                        raise ValueError(
+                            f"unknown apply mode {apply!r} in {CANONICAL_FILES[key]}: "
+                            f"expected one of {', '.join(CURSOR_APPLY_MODES)}"
+                        )
+                    rule = CursorSectionRule(name, path, description or heading_text, [], apply)
+                    rules[path] = rule
+                for glob in globs:
+                    if glob not in rule.globs:
+                        rule.globs.append(glob)
+                if key not in rule.sources:
+                    rule.sources.append(key)
+                rule.bodies.append(section_text(document, section))
+    return rules
+
+
+def build_cursor_section_rule(rule: CursorSectionRule, digest: str) -> str:
+    """セクション属性から作った Cursor rule (.mdc) の内容を生成する。"""
+    sources = ", ".join(CANONICAL_FILES[key].as_posix() for key in rule.sources)
+    return build_cursor_rule(
+        rule.description,
+        "\n\n".join(body for body in rule.bodies if body),
+        source=sources,
+        digest=digest,
+        apply=rule.apply,
+        globs=rule.globs,
+    )
+
+
+def orphaned_cursor_rules(root: Path, expected: set[Path]) -> list[Path]:
+    """生成済みだが、expected に含まれない（元のセクションがなくなった）個別 Cursor rule を返す。"""
+    orphans: list[Path] = []
+    for path in sorted((root / CURSOR_RULES_DIR).glob(f"{CURSOR_SECTION_RULE_PREFIX}*.mdc")):
+        rel_path = path.relative_to(root)
+        if rel_path not in expected and has_generated_header(path):
+            orphans.append(rel_path)
+    return orphans
+
+
+def scoped_body(document: MarkdownDocument, scope: str) -> str:
+    """scope に属するセクションだけを連結した本文を返す。"""
+    parts = [
+        section_text(document, section)
+        for section in annotated_sections(document)
+        if scope in section_scopes(section)
+    ]
+    return "\n\n".join(part for part in parts if part)
+
+
+def demote_headings(text: str) -> str:
+    """見出しを 1 段下げる（コードフェンス内は変更しない）。"""
+    lines: list[str] = []
+    in_fence = False
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            in_fence = not in_fence
+        elif not in_fence:
+            heading = MARKDOWN_HEADING_PATTERN.match(stripped)
+            if heading is not None and len(heading.group(1)) < 6:
+                line = line.replace("#", "##", 1)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def agent_scopes(canonical: dict[str, MarkdownDocument]) -> dict[str, list[str]]:
+    """AGENTS.md 用 canonical に現れる scope と、その scope を含む canonical キーを出現順で返す。"""
+    scopes: dict[str, list[str]] = {}
+    for key, _ in AGENTS_SECTIONS:
+        document = canonical.get(key)
+        if document is None:
+            continue
+        for section in annotated_sections(document):
+            for scope in section_scopes(section):
+                keys = scopes.setdefault(scope, [])
+                if key not in keys:
+                    keys.append(key)
+    return scopes
+
+
+def scoped_agents_path(scope: str) -> Path:
+    """scope ディレクトリ用 AGENTS.md の相対パスを返す。"""
+    return Path(scope) / OUTPUT_FILES["agents"]
+
+
+def has_generated_header(path: Path) -> bool:
+    """ファイル先頭に自動生成の注記があるか判定する。"""
+    with path.open("rb") as handle:
+        head = handle.read(HEADER_SCAN_BYTES).decode("utf-8", errors="replace")
+    return AUTO_GENERATED_NOTICE in head
+
+
+def agents_shard_candidates(root: Path) -> list[Path]:
+    """ルート以外にある AGENTS.md の相対パスを返す。
+
+    git 管理下では .gitignore 対象（依存パッケージなど）を走査しないよう git ls-files で列挙する。
+    """
+    name = OUTPUT_FILES["agents"].name
+    result = subprocess.run(
+        [
+            "git",
+            "-C",
+            str(root),
+            "ls-files",
+            "-z",
+            "--cached",
+            "--others",
+            "--exclude-standard",
+            "--",
+            f":(glob)**/{name}",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        check=False,
+    )
+    if result.returncode == 0:
+        paths = {Path(entry) for entry in result.stdout.decode("utf-8").split("\0") if entry}
+    else:
+        paths = {path.relative_to(root) for path in root.rglob(name)}
+    return sorted(path for path in paths if path != OUTPUT_FILES["agents"])
+
+
+def orphaned_agents_shards(root: Path, expected: set[Path]) -> list[Path]:
+    """生成済みだが、expected に含まれない（scope がなくなった）ディレクトリ側の AGENTS.md を返す。"""
+    return [
+        rel_path
+        for rel_path in agents_shard_candidates(root)
+        if rel_path not in expected
+        and (root / rel_path).is_file()
+        and has_generated_header(root / rel_path)
+    ]
+
+
+def as_document(markdown: str | MarkdownDocument) -> MarkdownDocument:
+    """文字列なら解析し、解析済みならそのまま返す。"""
+    if isinstance(markdown, MarkdownDocument):
+        return markdown
+    return parse_markdown(markdown)
+
+
+@dataclass
+class SyncState:
+    """解析済みの canonical と、そこから導出した依存関係・ハッシュを保持する。"""
+
+    canonical: dict[str, MarkdownDocument]
+    playbook_routes: list[tuple[str, str]]
+    playbooks: dict[str, MarkdownDocument]
+    selection: TargetSelection | None = None
+    dependencies: dict[Path, list[Path]] = field(default_factory=dict)
+    input_hashes: dict[str, str] = field(default_factory=dict)
+    digests: dict[Path, str] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        if self.selection is None:
+            output_names = None
+            playbook_names = list(self.playbooks)
+        else:
+            output_names = self.selection.outputs
+            playbook_names = [
+                playbook_name
+                for playbook_name in selected_playbook_names(self.selection, self.playbook_routes)
+                if playbook_name in self.playbooks
+            ]
+        self.dependencies = include_dependencies(
+            output_dependencies(
+                playbook_names, output_names, self.canonical, self.playbook_routes
+            ),
+            source_documents(self.canonical, self.playbooks),
+        )
+        self.input_hashes = hash_inputs(self.canonical, self.playbooks)
+        self.digests = output_digests(self.dependencies, self.input_hashes)
+
+    @property
+    def output_names(self) -> tuple[str, ...]:
+        """生成対象の名前を返す。"""
+        return (self.selection or ALL_TARGETS).outputs
+
+
+def auto_header(source: str, digest: str) -> str:
+    """生成ファイル向けヘッダを返す。digest は入力ダイジェスト（input_digest の戻り値）。"""
+    return (
+        AUTO_GENERATED_NOTICE
+        + f"<!-- source: {source} + scripts/sync_ai_context.py -->\n"
+        + f"<!-- inputs-sha256: {digest} generator: {GENERATOR_VERSION} -->\n"
+    )
+
+
+def strip_first_heading(markdown: str | MarkdownDocument) -> str:
+    """先頭見出しを除去して本文だけを返す。"""
+    return as_document(markdown).body
+
 
+def map_ordered(
+    func: Callable[[T], R],
+    items: list[T],
+    jobs: int = 1,
+    stop_when: Callable[[R], bool] | None = None,
+) -> list[R]:
+    """items に func を適用した結果を入力順で返す。
 
-def extract_playbook_routes(routing_markdown: str) -> list[tuple[str, str]]:
+    jobs > 1 のときはスレッドプールで並列実行する。stop_when が真を返した結果で
+    打ち切り、未着手の処理はキャンセルする。
+    """
+    if jobs <= 1 or len(items) <= 1:
+        sequential: list[R] = []
+        for item in items:
+            result = func(item)
+            sequential.append(result)
+            if stop_when is not None and stop_when(result):
+                break
+        return sequential
+
+    executor = ThreadPoolExecutor(max_workers=jobs)
+    try:
+        futures = [executor.submit(func, item) for item in items]
+        results: list[R] = []
+        for future in futures:
+            result = future.result()
+            results.append(result)
+            if stop_when is not None and stop_when(result):
+                break
+        return results
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def read_text(root: Path, rel_path: Path, reader: TextReader | None = None) -> str:
+    """reader があればそれで、なければ作業ツリーからファイルを読む。"""
+    if reader is not None:
+        return reader(rel_path)
+    return (root / rel_path).read_text(encoding="utf-8")
+
+
+def resolve_includes(
+    root: Path,
+    rel_path: Path,
+    text: str,
+    includes: dict[Path, list[Path]],
+    include_hashes: dict[Path, str],
+    stack: tuple[Path, ...] = (),
+    reader: TextReader | None = None,
+) -> str:
+    """``{{include: <path>}}`` だけの行を playbook 参照資料の内容に置き換えた本文を返す。
+
+    path は docs/ai/playbook-assets/ からの相対パスで、取り込んだ断片の中の include も
+    再帰的に展開する。includes にはファイルごとの直接の include 先を、include_hashes には
+    取り込んだ断片のハッシュを記録する。循環参照は ValueError にする。
+    """
+    stack = (*stack, rel_path)
+    direct: list[Path] = includes.setdefault(rel_path, [])
+    resolved: list[str] = []
+    in_fence = False
+    for line in text.splitlines():
+        if line.strip().startswith("```"):
+            in_fence = not in_fence
+        match = None if in_fence else INCLUDE_PATTERN.fullmatch(line)
+        if match is None:
+            resolved.append(line)
+            continue
+        fragment = PLAYBOOK_ASSETS_DIR / match.group(1)
+        if ".." in Path(match.group(1)).parts or Path(match.group(1)).is_absolute():
+            raise ValueError(f"include must stay under {PLAYBOOK_ASSETS_DIR}: {match.group(1)}")
+        if fragment in stack:
+            chain = " -> ".join(path.as_posix() for path in (*stack, fragment))
+            raise ValueError(f"include cycle: {chain}")
+        try:
+            fragment_text = read_text(root, fragment, reader)
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"missing include fragment: {root / fragment} (included from {rel_path})"
+            ) from None
+        if fragment not in direct:
+            direct.append(fragment)
+        include_hashes[fragment] = sha256_text(fragment_text)
+        resolved.append(
+            resolve_includes(
+                root, fragment, fragment_text, includes, include_hashes, stack, reader
+            ).strip("\n")
+        )
+    return "\n".join(resolved) + ("\n" if text.endswith("\n") else "")
+
+
+def read_source(
+    root: Path, rel_path: Path, label: str, reader: TextReader | None = None
+) -> MarkdownDocument:
+    """入力ファイルを読み込み、include を展開して解析する。"""
+    path = root / rel_path
+    with PROFILER.span(rel_path.as_posix(), "read") as record:
+        try:
+            text = read_text(root, rel_path, reader)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"missing {label}: {path}") from None
+        PROFILER.count(record, "bytes_read", text)
+        if "{{" not in text:
+            return parse_markdown(text)
+        includes: dict[Path, list[Path]] = {}
+        include_hashes: dict[Path, str] = {}
+        expanded = resolve_includes(
+            root, rel_path, text, includes, include_hashes, reader=reader
+        )
+        document = parse_markdown(expanded)
+        document.includes = {source: targets for source, targets in includes.items() if targets}
+        document.include_hashes = include_hashes
+        return document
+
+
+def read_canonical_file(
+    root: Path, rel_path: Path, reader: TextReader | None = None
+) -> MarkdownDocument:
+    """canonical ファイルを 1 件読み込んで解析する。"""
+    return read_source(root, rel_path, "canonical file", reader)
+
+
+def read_canonical(root: Path) -> dict[str, MarkdownDocument]:
+    """canonical ファイルを読み込み、解析済みの文書を返す。"""
+    return {key: read_canonical_file(root, rel_path) for key, rel_path in CANONICAL_FILES.items()}
+
+
+def extract_playbook_routes(
+    routing_markdown: str | MarkdownDocument,
+) -> list[tuple[str, str]]:
     """task-routing から (表示名, playbook名) の順序付き一覧を抽出する。"""
+    document = as_document(routing_markdown)
     routes: list[tuple[str, str]] = []
     seen: set[str] = set()
 
-    for line in routing_markdown.splitlines():
-        stripped = line.strip()
-        if not stripped.startswith("|"):
-            continue
-        link_match = ROUTING_TABLE_PLAYBOOK_LINK_PATTERN.search(stripped)
+    for row in document.table_rows:
+        link_match = ROUTING_TABLE_PLAYBOOK_LINK_PATTERN.search(row.raw)
         if link_match is None:
             continue
 
-        cells = [cell.strip() for cell in stripped.strip("|").split("|")]
-        header_candidate = cells[0].replace("`", "").strip() if cells else ""
+        header_candidate = row.cells[0].replace("`", "").strip() if row.cells else ""
         if header_candidate and header_candidate not in ROUTING_TABLE_HEADER_LABELS:
             label = header_candidate
         else:
@@ -84,8 +872,8 @@ def extract_playbook_routes(routing_markdown: str) -> list[tuple[str, str]]:
         routes.append((label, playbook))
         seen.add(playbook)
 
-    for line in routing_markdown.splitlines():
-        match = ROUTING_BULLET_PLAYBOOK_PATTERN.search(line.strip())
+    for bullet in document.bullets:
+        match = ROUTING_BULLET_PLAYBOOK_PATTERN.search(bullet.raw)
         if not match:
             continue
         label, playbook = match.group(1), match.group(2)
@@ -96,62 +884,334 @@ def extract_playbook_routes(routing_markdown: str) -> list[tuple[str, str]]:
     return routes
 
 
-def read_canonical_playbooks(root: Path, playbook_names: list[str]) -> dict[str, str]:
-    """playbook canonical を読み込む。"""
-    contents: dict[str, str] = {}
-    for playbook_name in playbook_names:
-        path = root / PLAYBOOK_CANONICAL_DIR / f"{playbook_name}.md"
-        if not path.exists():
-            raise FileNotFoundError(f"missing playbook canonical: {path}")
-        contents[playbook_name] = path.read_text(encoding="utf-8")
-    return contents
+def unquote(value: str) -> str:
+    """前後を囲む引用符を外す。"""
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+        return value[1:-1]
+    return value
+
+
+def parse_frontmatter(frontmatter: str | None) -> dict[str, str | list[str]]:
+    """frontmatter の ``key: value``、``key: [a, b]``、``- item`` 形式のリストを辞書にする。
+
+    YAML を完全には解釈せず、playbook のメタデータに使う単純な形式だけを扱う。
+    """
+    values: dict[str, str | list[str]] = {}
+    items: list[str] | None = None
+    for line in (frontmatter or "").splitlines():
+        stripped = line.strip()
+        if not stripped or stripped == "---" or stripped.startswith("#"):
+            continue
+        if items is not None and line[:1] in (" ", "\t", "-") and stripped.startswith("-"):
+            items.append(unquote(stripped[1:].strip()))
+            continue
+        key, separator, value = stripped.partition(":")
+        if not separator:
+            continue
+        key, value = key.strip(), value.strip()
+        items = None
+        if not value:
+            items = []
+            values[key] = items
+        elif value.startswith("[") and value.endswith("]"):
+            values[key] = [unquote(item.strip()) for item in value[1:-1].split(",") if item.strip()]
+        else:
+            values[key] = unquote(value)
+    return values
+
+
+@dataclass
+class PlaybookMetadata:
+    """playbook の frontmatter から読んだルーティング用のメタデータ。"""
+
+    name: str
+    description: str
+    labels: list[str]
+    triggers: list[str]
+    scopes: list[str]
+    order: int | None
+
 
+def playbook_metadata(playbook_name: str, document: MarkdownDocument) -> PlaybookMetadata:
+    """playbook の frontmatter から labels / triggers / scopes / order を読む。"""
+    values = parse_frontmatter(document.frontmatter)
 
-def with_auto_header(markdown: str, source: str) -> str:
+    def as_list(key: str) -> list[str]:
+        value = values.get(key, [])
+        return [value] if isinstance(value, str) else list(value)
+
+    order_value = values.get("order")
+    try:
+        order = None if order_value is None else int(str(order_value))
+    except ValueError:
+        raise ValueError(
+            f"order must be an integer in {PLAYBOOK_CANONICAL_DIR / f'{playbook_name}.md'}: "
+            f"{order_value}"
+        ) from None
+    description = values.get("description", "")
+    return PlaybookMetadata(
+        name=playbook_name,
+        description=description if isinstance(description, str) else " ".join(description),
+        labels=as_list("labels"),
+        triggers=as_list("triggers"),
+        scopes=as_list("scopes"),
+        order=order,
+    )
+
+
+def has_routing_table_placeholder(document: MarkdownDocument) -> bool:
+    """task-routing がルーティング表を ``{{routing-table}}`` で生成させるか判定する。"""
+    return any(ROUTING_TABLE_PLACEHOLDER_PATTERN.fullmatch(line) for line in document.lines)
+
+
+def discover_playbooks(root: Path, reader: TextReader | None = None) -> list[str]:
+    """docs/ai/canonical/playbooks/ にある playbook 名を名前順で返す。
+
+    インデックスから読む場合は、作業ツリーではなくインデックス上のファイルを列挙する。
+    """
+    if isinstance(reader, StagedBlobReader):
+        paths = reader.list_files(PLAYBOOK_CANONICAL_DIR)
+    else:
+        paths = [path.relative_to(root) for path in (root / PLAYBOOK_CANONICAL_DIR).glob("*.md")]
+    return sorted(
+        path.stem
+        for path in paths
+        if path.parent == PLAYBOOK_CANONICAL_DIR and path.suffix == ".md"
+    )
+
+
+def frontmatter_routes(playbooks: dict[str, MarkdownDocument]) -> list[tuple[str, str]]:
+    """frontmatter から (表示名, playbook名) の一覧を返す。
+
+    表示名は labels の先頭（なければ playbook 名）で、order の昇順、order のないものは
+    その後ろに名前順で並べる。
+    """
+    entries: list[tuple[bool, int, str, str]] = []
+    for playbook_name, document in playbooks.items():
+        metadata = playbook_metadata(playbook_name, document)
+        label = metadata.labels[0] if metadata.labels else playbook_name
+        order = metadata.order
+        entries.append((order is None, order or 0, playbook_name, label))
+    return [(label, playbook_name) for _, _, playbook_name, label in sorted(entries)]
+
+
+def playbook_inputs(
+    root: Path,
+    canonical: dict[str, MarkdownDocument],
+    selection: TargetSelection,
+    reader: TextReader | None = None,
+) -> tuple[list[tuple[str, str]] | None, list[str]]:
+    """(task-routing の表から得たルート, 読み込む playbook 名) を返す。
+
+    task-routing が ``{{routing-table}}`` で表を生成する場合は、ルートを playbook の
+    frontmatter から作るため None を返し、docs/ai/canonical/playbooks/ の全 playbook を読む。
+    index のように全 playbook のメタデータを使う対象が選ばれていれば、ルート上の全 playbook を読む。
+    """
+    routing = canonical.get("routing")
+    if routing is not None and has_routing_table_placeholder(routing):
+        return None, discover_playbooks(root, reader)
+    playbook_routes = extract_playbook_routes(routing) if routing is not None else []
+    playbook_names = selected_playbook_names(selection, playbook_routes)
+    if any(OUTPUT_TARGETS[name].playbook_inputs for name in selection.outputs):
+        playbook_names.extend(
+            playbook_name
+            for _, playbook_name in playbook_routes
+            if playbook_name not in playbook_names
+        )
+    return playbook_routes, playbook_names
+
+
+def read_canonical_playbooks(
+    root: Path, playbook_names: list[str], jobs: int = 1, reader: TextReader | None = None
+) -> dict[str, MarkdownDocument]:
+    """playbook canonical を読み込み、解析済みの文書を返す。"""
+
+    def read_one(playbook_name: str) -> MarkdownDocument:
+        rel_path = PLAYBOOK_CANONICAL_DIR / f"{playbook_name}.md"
+        return read_source(root, rel_path, "playbook canonical", reader)
+
+    contents = map_ordered(read_one, playbook_names, jobs)
+    return dict(zip(playbook_names, contents))
+
+
+def with_auto_header(markdown: str | MarkdownDocument, source: str, digest: str) -> str:
     """frontmatter がある場合は保持したまま自動生成ヘッダを挿入する。"""
-    header = auto_header(source)
-    body = markdown.strip() + "\n"
+    document = as_document(markdown)
+    header = auto_header(source, digest)
 
-    match = FRONTMATTER_PATTERN.match(body)
-    if match is None:
-        return f"{header}\n{body}"
+    if document.frontmatter is None:
+        return f"{header}\n{document.content}\n"
+
+    if document.content:
+        return f"{document.frontmatter}\n{header}\n{document.content}\n"
+    return f"{document.frontmatter}\n{header}\n"
+
+
+@dataclass
+class RenderContext:
+    """1 回の生成で全出力が共有する解析済み canonical と、そこから導出した本文。
+
+    本文は最初に要求されたときだけ組み立ててキャッシュするため、同じ本文を使う出力を
+    増やしても、追加の費用はその出力固有の整形だけになる。
+    """
+
+    canonical: dict[str, MarkdownDocument]
+    playbook_routes: list[tuple[str, str]]
+    playbooks: dict[str, MarkdownDocument] = field(default_factory=dict)
+    _cache: dict[tuple[str, str], str] = field(default_factory=dict, repr=False)
+
+    def cached(self, kind: str, key: str, build: Callable[[], str]) -> str:
+        """kind と key ごとに build の結果をキャッシュして返す。"""
+        cache_key = (kind, key)
+        if cache_key not in self._cache:
+            self._cache[cache_key] = build()
+        return self._cache[cache_key]
+
+    def unscoped_body(self, key: str) -> str:
+        """scope 付きセクションを除いた canonical の本文を返す。"""
+        return self.cached(
+            "unscoped", key, lambda: self.with_routing_table(key, unscoped_body(self.canonical[key]))
+        )
+
+    def cursor_always_body(self, key: str) -> str:
+        """個別 Cursor rule に切り出すセクションを除いた canonical の本文を返す。"""
+        return self.cached(
+            "cursor_always",
+            key,
+            lambda: self.with_routing_table(key, cursor_always_body(self.canonical[key])),
+        )
+
+    def metadata(self, playbook_name: str) -> PlaybookMetadata:
+        """playbook の frontmatter のメタデータを返す。読み込んでいない playbook は空とする。"""
+        document = self.playbooks.get(playbook_name)
+        if document is None:
+            return PlaybookMetadata(playbook_name, "", [], [], [], None)
+        return playbook_metadata(playbook_name, document)
+
+    def routing_table(self) -> str:
+        """playbook の frontmatter から task-routing のルーティング表を組み立てて返す。"""
+
+        def build() -> str:
+            lines = list(ROUTING_TABLE_HEADER)
+            for label, playbook_name in self.playbook_routes:
+                metadata = self.metadata(playbook_name)
+                condition = " / ".join(metadata.triggers) or metadata.description
+                condition = condition.replace("|", "\\|")
+                lines.append(
+                    f"| {label} | {condition} | "
+                    f"[{playbook_name}]({PLAYBOOK_OUTPUT_DIR.as_posix()}/{playbook_name}.md) |"
+                )
+            return "\n".join(lines)
+
+        return self.cached("routing_table", "", build)
+
+    def with_routing_table(self, key: str, body: str) -> str:
+        """task-routing の ``{{routing-table}}`` の行をルーティング表に置き換えた本文を返す。"""
+        if key != "routing" or "{{" not in body:
+            return body
+        return "\n".join(
+            self.routing_table() if ROUTING_TABLE_PLACEHOLDER_PATTERN.fullmatch(line) else line
+            for line in body.split("\n")
+        )
+
+    def agent_sections(self) -> str:
+        """AGENTS.md 形式の出力が共通で使う、番号付きセクションを連結した本文を返す。"""
+        return self.cached(
+            "agent_sections",
+            "",
+            lambda: "\n".join(
+                f"## {title}\n{self.unscoped_body(key)}\n" for key, title in AGENTS_SECTIONS
+            ),
+        )
+
+    def scoped_sections(self) -> str:
+        """scope 付きセクションを、見出しに対象ディレクトリを添えて並べた本文を返す。scope がなければ空。"""
+
+        def build() -> str:
+            parts: list[str] = []
+            for key, title in AGENTS_SECTIONS:
+                document = self.canonical.get(key)
+                if document is None:
+                    continue
+                emitted: set[tuple[int, int]] = set()
+                for section in annotated_sections(document):
+                    scopes = section_scopes(section)
+                    if not scopes or (section.start, section.end) in emitted:
+                        continue
+                    emitted.add((section.start, section.end))
+                    note = "（" + " / ".join(f"`{scope}/`" for scope in scopes) + " 配下のみ）"
+                    text = self.with_routing_table(key, section_text(document, section))
+                    if section.start == 0:
+                        parts.append(f"## {title}{note}\n\n{text}\n")
+                    else:
+                        heading, _, rest = text.partition("\n")
+                        parts.append(f"{heading}{note}\n{rest}\n")
+            if not parts:
+                return ""
+            return (
+                f"\n## {len(AGENTS_SECTIONS) + 1}. ディレクトリ別のルール\n"
+                "- 以下は、見出しに書いたディレクトリ配下で作業するときだけ適用する。\n\n"
+                + "\n".join(parts)
+            )
 
-    frontmatter = match.group(0).rstrip() + "\n"
-    remainder = body[match.end() :].strip()
-    if remainder:
-        return f"{frontmatter}\n{header}\n{remainder}\n"
-    return f"{frontmatter}\n{header}\n"
+        return self.cached("scoped_sections", "", build)
 
 
-def build_agents(canonical: dict[str, str]) -> str:
-    """AGENTS.md の内容を生成する。"""
-    global_body = strip_first_heading(canonical["global"])
-    routing_body = strip_first_heading(canonical["routing"])
-    coding_body = strip_first_heading(canonical["coding"])
+def build_agent_instructions(
+    title: str, context: RenderContext, digest: str, include_scoped: bool = False
+) -> str:
+    """AGENTS.md 形式のルート指示ファイルを生成する。
 
+    scope 付きセクションは、ディレクトリ別のファイルを読まないエージェント向け（include_scoped）
+    のときだけ、対象ディレクトリを明記した末尾のセクションにまとめる。
+    """
     return (
-        "# AGENTS.md\n\n"
-        f"{auto_header('docs/ai/canonical/*')}\n"
+        f"# {title}\n\n"
+        f"{auto_header('docs/ai/canonical/*', digest)}\n"
         "## このファイルについて\n"
         "- このファイルは自動生成です。直接編集しないでください。\n"
         "- 変更は `docs/ai/canonical/` を編集し、`python3 scripts/sync_ai_context.py` を実行してください。\n\n"
-        "## 1. グローバルポリシー\n"
-        f"{global_body}\n\n"
-        "## 2. タスクルーティング\n"
-        f"{routing_body}\n\n"
-        "## 3. コーディング標準\n"
-        f"{coding_body}\n"
+        + context.agent_sections()
+        + (context.scoped_sections() if include_scoped else "")
+    )
+
+
+def build_scoped_agents(canonical: dict[str, MarkdownDocument], scope: str, digest: str) -> str:
+    """scope ディレクトリ配下だけに適用するルールを集めた AGENTS.md を生成する。"""
+    sections = []
+    for key, title in AGENTS_SECTIONS:
+        body = scoped_body(canonical[key], scope)
+        if body:
+            sections.append(f"## {title}\n\n{demote_headings(body)}\n")
+    return (
+        "# AGENTS.md\n\n"
+        f"{auto_header(f'docs/ai/canonical/* (scope: {scope}/)', digest)}\n"
+        "## このファイルについて\n"
+        "- このファイルは自動生成です。直接編集しないでください。\n"
+        f"- `{scope}/` 配下で作業するときに、ルートの AGENTS.md に加えて適用するルールです。\n"
+        "- 変更は `docs/ai/canonical/` の `<!-- ai-context: scope=... -->` 付きセクションを編集してください。\n\n"
+        + "\n".join(sections)
     )
 
 
-def build_cursor_rule(description: str, body: str, source: str) -> str:
-    """Cursor rule (.mdc) の内容を生成する。"""
+def build_cursor_rule(
+    description: str,
+    body: str,
+    source: str,
+    digest: str,
+    apply: str = "always",
+    globs: list[str] | None = None,
+) -> str:
+    """Cursor rule (.mdc) の内容を生成する。apply が always 以外なら常時適用しない。"""
+    globs_line = f"globs: {','.join(globs)}\n" if globs else ""
+    always_apply = "true" if apply == "always" else "false"
     return (
         "---\n"
         f'description: "{description}"\n'
-        "alwaysApply: true\n"
+        f"{globs_line}"
+        f"alwaysApply: {always_apply}\n"
         "---\n\n"
-        f"{auto_header(source)}\n"
+        f"{auto_header(source, digest)}\n"
         f"{body.strip()}\n"
     )
 
@@ -181,138 +1241,1900 @@ def build_cursor_playbooks_rule(playbook_routes: list[tuple[str, str]]) -> str:
     return "\n".join(lines)
 
 
-def build_outputs(
-    canonical: dict[str, str],
-    playbook_routes: list[tuple[str, str]],
-    playbooks: dict[str, str],
-) -> dict[Path, str]:
-    """出力ファイル群を生成する。"""
-    global_body = strip_first_heading(canonical["global"])
-    routing_body = strip_first_heading(canonical["routing"])
-    coding_body = strip_first_heading(canonical["coding"])
-
-    cursor_global = "# グローバルポリシー\n\n" + global_body + "\n\n# コーディング標準\n\n" + coding_body
-    cursor_routing = "# タスクルーティング\n\n" + routing_body
-
-    outputs: dict[Path, str] = {
-        OUTPUT_FILES["agents"]: build_agents(canonical),
-        OUTPUT_FILES["cursor_global"]: build_cursor_rule(
-            "プロジェクト共通ポリシーと標準",
-            cursor_global,
-            source="docs/ai/canonical/*",
-        ),
-        OUTPUT_FILES["cursor_routing"]: build_cursor_rule(
-            "タスク別のPlaybookルーティング",
-            cursor_routing,
-            source="docs/ai/canonical/*",
-        ),
-        OUTPUT_FILES["cursor_playbooks"]: build_cursor_rule(
-            "共通Playbook参照ルール",
-            build_cursor_playbooks_rule(playbook_routes),
-            source="docs/ai/canonical/playbooks/*",
-        ),
-    }
-    for playbook_name, markdown in playbooks.items():
-        source = f"docs/ai/canonical/playbooks/{playbook_name}.md"
-        outputs[PLAYBOOK_OUTPUT_DIR / f"{playbook_name}.md"] = with_auto_header(markdown, source)
-    return outputs
+def render_agents(context: RenderContext, digest: str) -> str:
+    """AGENTS.md（Codex など）を生成する。"""
+    return build_agent_instructions("AGENTS.md", context, digest)
 
 
-def normalized_content(content: str) -> str:
-    """末尾改行を正規化した文字列を返す。"""
-    return content.rstrip() + "\n"
+def render_claude(context: RenderContext, digest: str) -> str:
+    """CLAUDE.md を生成する。"""
+    return build_agent_instructions("CLAUDE.md", context, digest, include_scoped=True)
 
 
-def validate_agents_size(outputs: dict[Path, str]) -> int:
-    """AGENTS.md のサイズを検査して、継続可否を返す。"""
-    agents_rel_path = OUTPUT_FILES["agents"]
-    agents_content = normalized_content(outputs[agents_rel_path])
-    size = len(agents_content.encode("utf-8"))
+def render_copilot(context: RenderContext, digest: str) -> str:
+    """GitHub Copilot のリポジトリ指示（.github/copilot-instructions.md）を生成する。"""
+    return build_agent_instructions("Copilot Instructions", context, digest, include_scoped=True)
 
-    if size > AGENTS_WARN_BYTES:
-        print(
-            f"[WARN] AGENTS.md size is {size} bytes "
-            f"(recommended <= {AGENTS_WARN_BYTES} bytes)."
-        )
 
-    if size > AGENTS_HARD_LIMIT_BYTES:
-        print(
-            f"[NG] AGENTS.md size is {size} bytes "
-            f"(hard limit: {AGENTS_HARD_LIMIT_BYTES} bytes)."
-        )
-        print("Move detailed procedures from AGENTS.md to docs/ai/playbooks/*.md.")
-        return 1
-    return 0
+def render_cursor_global(context: RenderContext, digest: str) -> str:
+    """共通ポリシーとコーディング標準の Cursor rule を生成する。"""
+    global_body = context.cursor_always_body("global")
+    coding_body = context.cursor_always_body("coding")
+    cursor_global = (
+        "# グローバルポリシー\n\n" + global_body + "\n\n# コーディング標準\n\n" + coding_body
+    )
+    return build_cursor_rule(
+        "プロジェクト共通ポリシーと標準",
+        cursor_global,
+        source="docs/ai/canonical/*",
+        digest=digest,
+    )
 
 
-def write_outputs(root: Path, outputs: dict[Path, str]) -> list[Path]:
-    """出力を書き込み、変更されたファイル一覧を返す。"""
-    changed: list[Path] = []
-    for rel_path, content in outputs.items():
-        path = root / rel_path
-        path.parent.mkdir(parents=True, exist_ok=True)
-        normalized = normalized_content(content)
-        if path.exists() and path.read_text(encoding="utf-8") == normalized:
-            continue
-        path.write_text(normalized, encoding="utf-8")
-        changed.append(rel_path)
-    return changed
+def render_cursor_routing(context: RenderContext, digest: str) -> str:
+    """タスクルーティングの Cursor rule を生成する。"""
+    cursor_routing = "# タスクルーティング\n\n" + context.cursor_always_body("routing")
+    return build_cursor_rule(
+        "タスク別のPlaybookルーティング",
+        cursor_routing,
+        source="docs/ai/canonical/*",
+        digest=digest,
+    )
 
 
-def check_outputs(root: Path, outputs: dict[Path, str]) -> list[Path]:
-    """期待値との差分があるファイル一覧を返す。"""
-    drift: list[Path] = []
-    for rel_path, content in outputs.items():
-        path = root / rel_path
-        expected = normalized_content(content)
-        if not path.exists() or path.read_text(encoding="utf-8") != expected:
-            drift.append(rel_path)
-    return drift
+def render_cursor_playbooks(context: RenderContext, digest: str) -> str:
+    """playbook 参照先の Cursor rule を生成する。
 
+    ルーティング rule が常時参照先を示すため、この一覧はエージェントが必要なときに読む
+    Agent Requested rule とする。
+    """
+    return build_cursor_rule(
+        "共通Playbook参照ルール。playbook の選択・実行時に参照する",
+        build_cursor_playbooks_rule(context.playbook_routes),
+        source="docs/ai/canonical/playbooks/*",
+        digest=digest,
+        apply="agent",
+    )
 
-def parse_args() -> argparse.Namespace:
-    """CLI 引数を解析する。"""
-    parser = argparse.ArgumentParser(description="AI context files synchronizer")
-    parser.add_argument("--check", action="store_true", help="差分検知のみ実施して終了する")
-    parser.add_argument(
-        "--root",
-        default=".",
-        help="テンプレートリポジトリのルートパス（既定: カレントディレクトリ）",
+
+def render_playbook_index(context: RenderContext, digest: str) -> str:
+    """playbook の frontmatter から、ルーティング用の索引（JSON）を生成する。
+
+    playbooks は playbook 名から、labels / triggers / scopes は各値から playbook 名の一覧を
+    直接引ける対応表にする。routes はルーティング表と同じ順序の playbook 名の一覧。
+    """
+    playbooks: dict[str, dict] = {}
+    lookup: dict[str, dict[str, list[str]]] = {key: {} for key in PLAYBOOK_INDEX_KEYS}
+    for label, playbook_name in context.playbook_routes:
+        metadata = context.metadata(playbook_name)
+        entry = {
+            "path": (PLAYBOOK_OUTPUT_DIR / f"{playbook_name}.md").as_posix(),
+            "label": label,
+            "description": metadata.description,
+            "labels": metadata.labels or [label],
+            "triggers": metadata.triggers,
+            "scopes": metadata.scopes,
+        }
+        playbooks[playbook_name] = entry
+        for key in PLAYBOOK_INDEX_KEYS:
+            for value in entry[key]:
+                names = lookup[key].setdefault(value, [])
+                if playbook_name not in names:
+                    names.append(playbook_name)
+    index = {
+        "_generated": auto_header(f"{PLAYBOOK_CANONICAL_DIR.as_posix()}/*", digest).splitlines(),
+        "routes": [playbook_name for _, playbook_name in context.playbook_routes],
+        "playbooks": playbooks,
+        **lookup,
+    }
+    return json.dumps(index, ensure_ascii=False, indent=2) + "\n"
+
+
+@dataclass(frozen=True)
+class OutputTarget:
+    """固定の生成対象 1 件。build は対象が選ばれたときだけ呼ばれる。
+
+    新しいエージェント向けファイルは、ここに 1 件追加し、RenderContext の共有本文を使う
+    build を書けば、--only・--check・manifest による差分生成の対象になる。
+    playbook_inputs の対象はルート上の全 playbook canonical に依存する。
+    """
+
+    name: str
+    group: str
+    path: Path
+    canonical_keys: tuple[str, ...]
+    build: Callable[[RenderContext, str], str]
+    playbook_inputs: bool = False
+
+
+OUTPUT_TARGETS: dict[str, OutputTarget] = {
+    target.name: target
+    for target in [
+        OutputTarget(
+            "agents",
+            "agents",
+            OUTPUT_FILES["agents"],
+            ("global", "routing", "coding"),
+            render_agents,
+        ),
+        OutputTarget(
+            "cursor_global",
+            "cursor",
+            OUTPUT_FILES["cursor_global"],
+            ("global", "coding"),
+            render_cursor_global,
+        ),
+        OutputTarget(
+            "cursor_routing",
+            "cursor",
+            OUTPUT_FILES["cursor_routing"],
+            ("routing",),
+            render_cursor_routing,
+        ),
+        OutputTarget(
+            "cursor_playbooks",
+            "cursor",
+            OUTPUT_FILES["cursor_playbooks"],
+            ("routing",),
+            render_cursor_playbooks,
+        ),
+        OutputTarget(
+            "claude",
+            "claude",
+            OUTPUT_FILES["claude"],
+            ("global", "routing", "coding"),
+            render_claude,
+        ),
+        OutputTarget(
+            "copilot",
+            "copilot",
+            OUTPUT_FILES["copilot"],
+            ("global", "routing", "coding"),
+            render_copilot,
+        ),
+        OutputTarget(
+            "playbook_index",
+            "index",
+            OUTPUT_FILES["playbook_index"],
+            ("routing",),
+            render_playbook_index,
+            playbook_inputs=True,
+        ),
+    ]
+}
+
+
+@dataclass(frozen=True)
+class TargetSelection:
+    """--only で選ばれた生成対象。playbooks が None なら routing 上の全 playbook。"""
+
+    outputs: tuple[str, ...]
+    playbooks: tuple[str, ...] | None
+
+    def canonical_keys(self) -> list[str]:
+        """選ばれた対象の生成に必要な canonical のキーを返す。"""
+        keys = {key for name in self.outputs for key in OUTPUT_TARGETS[name].canonical_keys}
+        if self.playbooks is None:
+            keys.add("routing")
+        return [key for key in CANONICAL_FILES if key in keys]
+
+
+ALL_TARGETS = TargetSelection(tuple(OUTPUT_TARGETS), None)
+
+
+def parse_only(values: list[str]) -> TargetSelection:
+    """--only の指定値（agents / cursor / playbooks / playbook:<name> / 対象名）を解釈する。"""
+    if not values:
+        return ALL_TARGETS
+    outputs: list[str] = []
+    playbooks: list[str] | None = []
+    for value in values:
+        if value.startswith("playbook:"):
+            playbook_name = value.split(":", 1)[1]
+            if not playbook_name:
+                raise ValueError(f"playbook name is empty: {value}")
+            if playbooks is not None and playbook_name not in playbooks:
+                playbooks.append(playbook_name)
+        elif value == "playbooks":
+            playbooks = None
+        elif value in OUTPUT_TARGETS:
+            outputs.append(value)
+        elif any(target.group == value for target in OUTPUT_TARGETS.values()):
+            outputs.extend(name for name, target in OUTPUT_TARGETS.items() if target.group == value)
+        else:
+            raise ValueError(f"unknown --only target: {value}")
+    ordered = tuple(name for name in OUTPUT_TARGETS if name in outputs)
+    return TargetSelection(ordered, None if playbooks is None else tuple(playbooks))
+
+
+def selected_playbook_names(
+    selection: TargetSelection, playbook_routes: list[tuple[str, str]]
+) -> list[str]:
+    """選択に含まれる playbook 名を返す。"""
+    if selection.playbooks is None:
+        return [playbook_name for _, playbook_name in playbook_routes]
+    return list(selection.playbooks)
+
+
+def build_outputs(
+    canonical: dict[str, MarkdownDocument],
+    playbook_routes: list[tuple[str, str]],
+    playbooks: dict[str, MarkdownDocument],
+    targets: set[Path] | None = None,
+    digests: dict[Path, str] | None = None,
+) -> dict[Path, str]:
+    """出力ファイル群を生成する。
+
+    digests に含まれる出力だけが対象で、targets 指定時はさらにその出力に絞る。
+    各出力は対象になったときだけ生成する。
+    """
+    if digests is None:
+        digests = output_digests(
+            include_dependencies(
+                output_dependencies(
+                    list(playbooks), canonical=canonical, playbook_routes=playbook_routes
+                ),
+                source_documents(canonical, playbooks),
+            ),
+            hash_inputs(canonical, playbooks),
+        )
+
+    def wanted(rel_path: Path) -> bool:
+        return rel_path in digests and (targets is None or rel_path in targets)
+
+    context = RenderContext(canonical, playbook_routes, playbooks)
+    outputs: dict[Path, str] = {}
+    with PROFILER.span("render"):
+        for target in OUTPUT_TARGETS.values():
+            if not wanted(target.path):
+                continue
+            with PROFILER.span(target.path.as_posix(), "render"):
+                outputs[target.path] = target.build(context, digests[target.path])
+        if OUTPUT_FILES["agents"] in digests:
+            for scope in agent_scopes(canonical):
+                rel_path = scoped_agents_path(scope)
+                if not wanted(rel_path):
+                    continue
+                with PROFILER.span(rel_path.as_posix(), "render"):
+                    outputs[rel_path] = build_scoped_agents(canonical, scope, digests[rel_path])
+        output_names = tuple(
+            name for name, target in OUTPUT_TARGETS.items() if target.path in digests
+        )
+        for rel_path, rule in cursor_section_rules(canonical, output_names).items():
+            if not wanted(rel_path):
+                continue
+            with PROFILER.span(rel_path.as_posix(), "render"):
+                outputs[rel_path] = build_cursor_section_rule(rule, digests[rel_path])
+        for playbook_name, document in playbooks.items():
+            rel_path = PLAYBOOK_OUTPUT_DIR / f"{playbook_name}.md"
+            if not wanted(rel_path):
+                continue
+            source = f"docs/ai/canonical/playbooks/{playbook_name}.md"
+            with PROFILER.span(rel_path.as_posix(), "render"):
+                outputs[rel_path] = with_auto_header(document, source, digests[rel_path])
+    return outputs
+
+
+def output_dependencies(
+    playbook_names: list[str],
+    output_names: tuple[str, ...] | None = None,
+    canonical: dict[str, MarkdownDocument] | None = None,
+    playbook_routes: list[tuple[str, str]] | None = None,
+) -> dict[Path, list[Path]]:
+    """出力ファイルごとに、内容が依存する canonical ファイル一覧を返す。
+
+    canonical を渡すと、セクション属性から生まれるディレクトリ別 AGENTS.md と
+    個別 Cursor rule も含める。playbook_inputs の対象と、ルーティング表を frontmatter から
+    生成するときの task-routing を使う対象は、playbook_routes 上の全 playbook にも依存する。
+    ディレクトリ別 AGENTS.md は、その scope のセクションを含む canonical だけに依存する。
+    """
+    names = tuple(OUTPUT_TARGETS) if output_names is None else output_names
+    routed_playbooks = [
+        PLAYBOOK_CANONICAL_DIR / f"{playbook_name}.md"
+        for _, playbook_name in playbook_routes or []
+    ]
+    generated_routing = (
+        canonical is not None
+        and "routing" in canonical
+        and has_routing_table_placeholder(canonical["routing"])
     )
-    return parser.parse_args()
+    dependencies: dict[Path, list[Path]] = {}
+    for name in names:
+        target = OUTPUT_TARGETS[name]
+        inputs = [CANONICAL_FILES[key] for key in target.canonical_keys]
+        if target.playbook_inputs or (generated_routing and "routing" in target.canonical_keys):
+            inputs.extend(routed_playbooks)
+        dependencies[target.path] = inputs
+    if canonical is not None and "agents" in names:
+        for scope, keys in agent_scopes(canonical).items():
+            dependencies[scoped_agents_path(scope)] = [CANONICAL_FILES[key] for key in keys]
+    if canonical is not None:
+        for rel_path, rule in cursor_section_rules(canonical, names).items():
+            dependencies[rel_path] = [CANONICAL_FILES[key] for key in rule.sources]
+    for playbook_name in playbook_names:
+        dependencies[PLAYBOOK_OUTPUT_DIR / f"{playbook_name}.md"] = [
+            PLAYBOOK_CANONICAL_DIR / f"{playbook_name}.md"
+        ]
+    return dependencies
 
 
-def main() -> int:
-    """メイン処理。"""
-    args = parse_args()
-    root = Path(args.root).resolve()
-    canonical = read_canonical(root)
-    playbook_routes = extract_playbook_routes(canonical["routing"])
-    playbook_names = [playbook_name for _, playbook_name in playbook_routes]
-    playbooks = read_canonical_playbooks(root, playbook_names)
-    outputs = build_outputs(canonical, playbook_routes, playbooks)
-    size_validation = validate_agents_size(outputs)
-    if size_validation != 0:
-        return size_validation
+def include_dependencies(
+    dependencies: dict[Path, list[Path]], documents: dict[Path, MarkdownDocument]
+) -> dict[Path, list[Path]]:
+    """出力ごとの依存に、各入力が（推移的に）取り込む断片を加えた依存関係を返す。"""
+    expanded: dict[Path, list[Path]] = {}
+    for rel_path, inputs in dependencies.items():
+        fragments = {
+            fragment
+            for source in inputs
+            if source in documents
+            for fragment in documents[source].include_hashes
+        }
+        expanded[rel_path] = inputs + sorted(fragments - set(inputs))
+    return expanded
 
-    if args.check:
-        drift = check_outputs(root, outputs)
-        if drift:
-            print("[NG] Generated files are out of date:")
-            for rel_path in drift:
-                print(f"  - {rel_path}")
-            print("Run: python3 scripts/sync_ai_context.py")
-            return 1
-        print("[OK] Generated files are up to date.")
+
+def explain_output(
+    rel_path: Path,
+    dependencies: dict[Path, list[Path]],
+    documents: dict[Path, MarkdownDocument],
+    input_hashes: dict[str, str],
+) -> list[str]:
+    """出力が依存する入力を、include の入れ子を字下げした行の一覧で返す。"""
+    lines = [rel_path.as_posix()]
+
+    def visit(source: Path, graph: dict[Path, list[Path]], depth: int) -> None:
+        digest = input_hashes.get(source.as_posix(), "")[:12]
+        lines.append(f"{'  ' * depth}- {source.as_posix()}  {digest}".rstrip())
+        for fragment in graph.get(source, []):
+            visit(fragment, graph, depth + 1)
+
+    for source in dependencies[rel_path]:
+        document = documents.get(source)
+        if document is None:
+            continue
+        visit(source, document.includes, 1)
+    return lines
+
+
+def sha256_text(content: str) -> str:
+    """文字列の SHA-256 ダイジェストを返す。"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def generator_fingerprint() -> str:
+    """生成ロジックの版を返す。スクリプト自体が変わればキャッシュを無効化する。"""
+    script_digest = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+    return f"{GENERATOR_VERSION}+{script_digest[:16]}"
+
+
+def hash_inputs(
+    canonical: dict[str, MarkdownDocument], playbooks: dict[str, MarkdownDocument]
+) -> dict[str, str]:
+    """canonical 入力ごとのハッシュを相対パスをキーに返す。"""
+    hashes: dict[str, str] = {}
+    for key, document in canonical.items():
+        hashes[CANONICAL_FILES[key].as_posix()] = sha256_text(document.text)
+    for playbook_name, document in playbooks.items():
+        rel_path = PLAYBOOK_CANONICAL_DIR / f"{playbook_name}.md"
+        hashes[rel_path.as_posix()] = sha256_text(document.text)
+    for document in [*canonical.values(), *playbooks.values()]:
+        for fragment, digest in document.include_hashes.items():
+            hashes[fragment.as_posix()] = digest
+    return hashes
+
+
+@functools.lru_cache(maxsize=None)
+def manifest_path(root: Path) -> Path:
+    """manifest の保存先を返す。git 管理外のルートでは MANIFEST_PATH に置く。"""
+    result = subprocess.run(
+        ["git", "-C", str(root), "rev-parse", "--git-path", MANIFEST_GIT_PATH],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        check=False,
+    )
+    git_path = result.stdout.strip()
+    if result.returncode != 0 or not git_path:
+        return root / MANIFEST_PATH
+    return root / git_path
+
+
+def load_manifest(root: Path) -> dict:
+    """前回実行の manifest を読み込む。存在しない・読めない・壊れている場合は空を返す。"""
+    try:
+        manifest = json.loads(manifest_path(root).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict) or manifest.get("generator") != generator_fingerprint():
+        return {}
+    return manifest
+
+
+def save_manifest(root: Path, manifest: dict) -> None:
+    """manifest を書き込む。
+
+    manifest は再実行を速くするためだけのものなので、書き込めない（読み取り専用の
+    チェックアウトなど）場合は警告だけ出して続行する。
+    """
+    path = manifest_path(root)
+    content = json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True) + "\n"
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+    except OSError as exc:
+        print(f"[WARN] Could not write manifest {path}: {exc}")
+
+
+def input_digest(inputs: list[Path], input_hashes: dict[str, str]) -> str:
+    """出力が依存する入力ハッシュと生成器バージョンから入力ダイジェストを求める。"""
+    hasher = hashlib.sha256(f"generator:{GENERATOR_VERSION}\n".encode("utf-8"))
+    for key in sorted(path.as_posix() for path in inputs):
+        hasher.update(f"{key}\0{input_hashes[key]}\n".encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def output_digests(
+    dependencies: dict[Path, list[Path]], input_hashes: dict[str, str]
+) -> dict[Path, str]:
+    """出力ファイルごとの入力ダイジェストを返す。"""
+    return {
+        rel_path: input_digest(inputs, input_hashes) for rel_path, inputs in dependencies.items()
+    }
+
+
+def read_header_digest(path: Path, reader: TextReader | None = None) -> tuple[str, str] | None:
+    """生成ファイル先頭から (入力ダイジェスト, 生成器バージョン) を読み取る。
+
+    reader を渡した場合、path はルートからの相対パスとして reader で読む。
+    """
+    try:
+        if reader is not None:
+            head = reader(path)[:HEADER_SCAN_BYTES]
+        else:
+            with path.open("rb") as handle:
+                head = handle.read(HEADER_SCAN_BYTES).decode("utf-8", errors="replace")
+    except FileNotFoundError:
+        return None
+    match = INPUT_DIGEST_PATTERN.search(head)
+    if match is None:
+        return None
+    return match.group(1), match.group(2)
+
+
+def check_output_headers(
+    root: Path,
+    digests: dict[Path, str],
+    jobs: int = 1,
+    fail_fast: bool = False,
+    reader: TextReader | None = None,
+) -> list[Path]:
+    """ヘッダの入力ダイジェストが期待値と異なるファイル一覧を返す。"""
+
+    def drifted(rel_path: Path) -> bool:
+        with PROFILER.span(rel_path.as_posix(), "compare"):
+            path = rel_path if reader is not None else root / rel_path
+            return read_header_digest(path, reader) != (digests[rel_path], GENERATOR_VERSION)
+
+    rel_paths = list(digests)
+    with PROFILER.span("compare_headers"):
+        results = map_ordered(drifted, rel_paths, jobs, stop_when=bool if fail_fast else None)
+    return [rel_path for rel_path, is_drift in zip(rel_paths, results) if is_drift]
+
+
+def dependency_hashes(inputs: list[Path], input_hashes: dict[str, str]) -> dict[str, str]:
+    """出力が依存する入力だけのハッシュ対応表を返す。"""
+    return {path.as_posix(): input_hashes[path.as_posix()] for path in inputs}
+
+
+def stale_outputs(
+    root: Path,
+    manifest: dict,
+    input_hashes: dict[str, str],
+    dependencies: dict[Path, list[Path]],
+    compact: bool = False,
+) -> list[Path]:
+    """manifest と比較して再生成が必要な出力ファイル一覧を返す。圧縮の有無が違う出力も含める。"""
+    recorded_outputs = manifest.get("outputs", {})
+    stale: list[Path] = []
+    for rel_path, inputs in dependencies.items():
+        entry = recorded_outputs.get(rel_path.as_posix())
+        if (
+            entry is None
+            or entry.get("inputs") != dependency_hashes(inputs, input_hashes)
+            or entry.get("compact", False) != compact
+        ):
+            stale.append(rel_path)
+            continue
+        try:
+            stat = (root / rel_path).stat()
+        except FileNotFoundError:
+            stale.append(rel_path)
+            continue
+        if entry.get("size") != stat.st_size or entry.get("mtime_ns") != stat.st_mtime_ns:
+            stale.append(rel_path)
+    return stale
+
+
+def update_manifest(
+    root: Path,
+    manifest: dict,
+    input_hashes: dict[str, str],
+    dependencies: dict[Path, list[Path]],
+    verified: dict[Path, str],
+    compact: bool = False,
+) -> dict:
+    """最新と確認できた出力を manifest に記録した新しい manifest を返す。"""
+    outputs: dict[str, dict] = dict(manifest.get("outputs", {}))
+    for rel_path, inputs in dependencies.items():
+        if rel_path not in verified:
+            continue
+        stat = (root / rel_path).stat()
+        entry = {
+            "inputs": dependency_hashes(inputs, input_hashes),
+            "sha256": sha256_text(normalized_content(verified[rel_path])),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+        if compact:
+            entry["compact"] = True
+        outputs[rel_path.as_posix()] = entry
+    return {"generator": generator_fingerprint(), "outputs": outputs}
+
+
+def normalized_content(content: str) -> str:
+    """末尾改行を正規化した文字列を返す。"""
+    return content.rstrip() + "\n"
+
+
+def validate_agents_size(outputs: dict[Path, str]) -> int:
+    """AGENTS.md のサイズを検査して、継続可否を返す。"""
+    agents_rel_path = OUTPUT_FILES["agents"]
+    with PROFILER.span("validate_size"):
+        agents_content = normalized_content(outputs[agents_rel_path])
+        size = len(agents_content.encode("utf-8"))
+
+    if size > AGENTS_WARN_BYTES:
+        print(
+            f"[WARN] AGENTS.md size is {size} bytes "
+            f"(recommended <= {AGENTS_WARN_BYTES} bytes)."
+        )
+
+    if size > AGENTS_HARD_LIMIT_BYTES:
+        print(
+            f"[NG] AGENTS.md size is {size} bytes "
+            f"(hard limit: {AGENTS_HARD_LIMIT_BYTES} bytes)."
+        )
+        print("Move detailed procedures from AGENTS.md to docs/ai/playbooks/*.md.")
+        return 1
+    return 0
+
+
+def read_existing(path: Path) -> str | None:
+    """既存ファイルを読み込む。存在しない場合は None を返す。"""
+    try:
+        return path.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+
+
+def write_outputs(root: Path, outputs: dict[Path, str], jobs: int = 1) -> list[Path]:
+    """出力を書き込み、変更されたファイル一覧を返す。"""
+
+    def write_one(rel_path: Path) -> bool:
+        path = root / rel_path
+        with PROFILER.span(rel_path.as_posix(), "write") as record:
+            normalized = normalized_content(outputs[rel_path])
+            existing = read_existing(path)
+            PROFILER.count(record, "bytes_read", existing)
+            if existing == normalized:
+                return False
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(normalized, encoding="utf-8")
+            PROFILER.count(record, "bytes_written", normalized)
+            return True
+
+    rel_paths = list(outputs)
+    with PROFILER.span("write"):
+        results = map_ordered(write_one, rel_paths, jobs)
+    return [rel_path for rel_path, changed in zip(rel_paths, results) if changed]
+
+
+def check_outputs(
+    root: Path,
+    outputs: dict[Path, str],
+    jobs: int = 1,
+    fail_fast: bool = False,
+    reader: TextReader | None = None,
+) -> list[Path]:
+    """期待値との差分があるファイル一覧を返す。fail_fast 時は最初の差分で打ち切る。
+
+    reader を渡すと作業ツリーではなく reader（例: インデックス）から既存の内容を読む。
+    """
+
+    def drifted(rel_path: Path) -> bool:
+        with PROFILER.span(rel_path.as_posix(), "compare") as record:
+            if reader is None:
+                existing = read_existing(root / rel_path)
+            else:
+                try:
+                    existing = reader(rel_path)
+                except FileNotFoundError:
+                    existing = None
+            PROFILER.count(record, "bytes_read", existing)
+            return existing != normalized_content(outputs[rel_path])
+
+    rel_paths = list(outputs)
+    with PROFILER.span("compare"):
+        results = map_ordered(drifted, rel_paths, jobs, stop_when=bool if fail_fast else None)
+    return [rel_path for rel_path, is_drift in zip(rel_paths, results) if is_drift]
+
+
+def load_sync_state(
+    root: Path,
+    jobs: int = 1,
+    selection: TargetSelection = ALL_TARGETS,
+    reader: TextReader | None = None,
+) -> SyncState:
+    """選ばれた対象の生成に必要な canonical だけを読み込み、同期状態を作る。"""
+    with PROFILER.span("read_canonical"):
+        canonical = {
+            key: read_canonical_file(root, CANONICAL_FILES[key], reader)
+            for key in selection.canonical_keys()
+        }
+    with PROFILER.span("extract_routes"):
+        playbook_routes, playbook_names = playbook_inputs(root, canonical, selection, reader)
+    with PROFILER.span("read_playbooks"):
+        playbooks = read_canonical_playbooks(root, playbook_names, jobs=jobs, reader=reader)
+    if playbook_routes is None:
+        playbook_routes = frontmatter_routes(playbooks)
+    with PROFILER.span("hash_inputs"):
+        return SyncState(canonical, playbook_routes, playbooks, selection)
+
+
+def refresh_sync_state(
+    root: Path, state: SyncState, changed: set[Path]
+) -> tuple[SyncState, set[Path]]:
+    """変更された入力だけを読み直した新しい状態と、再生成が必要な出力を返す。"""
+    canonical = dict(state.canonical)
+    for key in canonical:
+        if CANONICAL_FILES[key] in changed or changed & canonical[key].include_hashes.keys():
+            canonical[key] = read_canonical_file(root, CANONICAL_FILES[key])
+
+    selection = state.selection or ALL_TARGETS
+    playbook_routes, playbook_names = playbook_inputs(root, canonical, selection)
+    reload_names = [
+        playbook_name
+        for playbook_name in playbook_names
+        if playbook_name not in state.playbooks
+        or PLAYBOOK_CANONICAL_DIR / f"{playbook_name}.md" in changed
+        or changed & state.playbooks[playbook_name].include_hashes.keys()
+    ]
+    reloaded = read_canonical_playbooks(root, reload_names)
+    playbooks = {
+        playbook_name: reloaded.get(playbook_name) or state.playbooks[playbook_name]
+        for playbook_name in playbook_names
+    }
+    if playbook_routes is None:
+        playbook_routes = frontmatter_routes(playbooks)
+
+    refreshed = SyncState(canonical, playbook_routes, playbooks, state.selection)
+    affected = {
+        rel_path
+        for rel_path, digest in refreshed.digests.items()
+        if state.digests.get(rel_path) != digest
+    }
+    return refreshed, affected
+
+
+def sync_state_outputs(
+    root: Path,
+    state: SyncState,
+    targets: set[Path],
+    manifest: dict,
+    jobs: int = 1,
+    use_cache: bool = True,
+    compact: bool = False,
+) -> tuple[list[Path], dict] | None:
+    """targets の出力を生成して書き込み、(変更ファイル一覧, 新しい manifest) を返す。
+
+    compact 時は書き込み前に出力を詰め、削減量を表示する。
+    AGENTS.md のサイズ検査に失敗した場合は何も書き込まず None を返す。
+    """
+    outputs = build_outputs(
+        state.canonical,
+        state.playbook_routes,
+        state.playbooks,
+        targets=targets,
+        digests=state.digests,
+    )
+    if compact:
+        outputs, savings = compact_outputs(outputs)
+        report_compaction(savings)
+    if OUTPUT_FILES["agents"] in outputs and validate_agents_size(outputs) != 0:
+        return None
+    changed = write_outputs(root, outputs, jobs=jobs)
+    changed.extend(remove_orphaned_outputs(root, state.dependencies, state.output_names))
+    if outputs and use_cache:
+        manifest = update_manifest(
+            root, manifest, state.input_hashes, state.dependencies, outputs, compact
+        )
+        save_manifest(root, manifest)
+    return changed, manifest
+
+
+def orphaned_outputs(
+    root: Path, dependencies: dict[Path, list[Path]], output_names: tuple[str, ...]
+) -> list[Path]:
+    """生成済みだが dependencies に含まれなくなった出力を返す。
+
+    個別 Cursor rule は Cursor の対象がすべて output_names にあるとき、ディレクトリ側の
+    AGENTS.md は agents があるときだけ判定する。
+    """
+    expected = set(dependencies)
+    orphans: list[Path] = []
+    if "agents" in output_names:
+        orphans.extend(orphaned_agents_shards(root, expected))
+    if {"cursor_global", "cursor_routing"} <= set(output_names):
+        orphans.extend(orphaned_cursor_rules(root, expected))
+    return orphans
+
+
+def remove_orphaned_outputs(
+    root: Path, dependencies: dict[Path, list[Path]], output_names: tuple[str, ...]
+) -> list[Path]:
+    """生成されなくなった出力を削除し、削除したパスを返す。"""
+    orphans = orphaned_outputs(root, dependencies, output_names)
+    for rel_path in orphans:
+        (root / rel_path).unlink()
+    return orphans
+
+
+def snapshot_canonical(root: Path) -> dict[Path, tuple[int, int]]:
+    """docs/ai/canonical と docs/ai/playbook-assets 配下のファイルごとに (mtime_ns, size) を返す。"""
+    signatures: dict[Path, tuple[int, int]] = {}
+    for source_dir in (CANONICAL_DIR, PLAYBOOK_ASSETS_DIR):
+        for path in (root / source_dir).rglob("*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if path.is_file():
+                signatures[path.relative_to(root)] = (stat.st_mtime_ns, stat.st_size)
+    return signatures
+
+
+def changed_paths(
+    before: dict[Path, tuple[int, int]], after: dict[Path, tuple[int, int]]
+) -> set[Path]:
+    """2 つの snapshot の間で追加・変更・削除されたパスを返す。"""
+    return {
+        rel_path
+        for rel_path in before.keys() | after.keys()
+        if before.get(rel_path) != after.get(rel_path)
+    }
+
+
+def wait_for_changes(
+    root: Path, snapshot: dict[Path, tuple[int, int]], interval: float, debounce: float
+) -> tuple[dict[Path, tuple[int, int]], set[Path]]:
+    """canonical の変更をポーリングで待ち、保存が落ち着いた時点の状態と変更パスを返す。"""
+    while True:
+        time.sleep(interval)
+        current = snapshot_canonical(root)
+        if current != snapshot:
+            break
+    while True:
+        time.sleep(debounce)
+        latest = snapshot_canonical(root)
+        if latest == current:
+            break
+        current = latest
+    changed = changed_paths(snapshot, current)
+    return current, changed
+
+
+def watch(root: Path, args: argparse.Namespace) -> int:
+    """canonical を監視し、変更のたびに影響する出力だけを再生成する。"""
+    use_cache = not args.no_cache
+    state = load_sync_state(root, jobs=args.jobs, selection=args.only)
+    manifest = load_manifest(root) if use_cache else {}
+    targets = set(
+        stale_outputs(root, manifest, state.input_hashes, state.dependencies, args.compact)
+    )
+    result = sync_state_outputs(
+        root, state, targets, manifest, args.jobs, use_cache, args.compact
+    )
+    if result is not None:
+        changed, manifest = result
+        report_changed(changed)
+
+    snapshot = snapshot_canonical(root)
+    print(
+        f"[WATCH] Watching {CANONICAL_DIR.as_posix()}/** and "
+        f"{PLAYBOOK_ASSETS_DIR.as_posix()}/** (Ctrl+C to stop)",
+        flush=True,
+    )
+    # 反映に失敗した変更は、次の変更時にまとめて読み直す
+    pending: set[Path] = set()
+    try:
+        while True:
+            snapshot, changed_inputs = wait_for_changes(
+                root, snapshot, args.watch_interval, args.debounce
+            )
+            pending |= changed_inputs
+            started = time.perf_counter()
+            try:
+                refreshed, targets = refresh_sync_state(root, state, pending)
+                result = sync_state_outputs(
+                    root, refreshed, targets, manifest, args.jobs, use_cache, args.compact
+                )
+            except (FileNotFoundError, ValueError) as exc:
+                print(f"[WARN] {exc}", flush=True)
+                continue
+            if result is None:
+                continue
+            state = refreshed
+            pending.clear()
+            changed, manifest = result
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if changed:
+                print(f"[OK] Updated generated files in {elapsed_ms:.1f} ms:", flush=True)
+                for rel_path in changed:
+                    print(f"  - {rel_path}", flush=True)
+    except KeyboardInterrupt:
         return 0
 
-    changed = write_outputs(root, outputs)
+
+def git_pathspecs() -> list[str]:
+    """--since で差分を調べる、同期の入力・出力・生成器のパス指定を返す。"""
+    outputs = {path.as_posix() for path in OUTPUT_FILES.values()}
+    return [
+        CANONICAL_DIR.as_posix(),
+        PLAYBOOK_ASSETS_DIR.as_posix(),
+        PLAYBOOK_OUTPUT_DIR.as_posix(),
+        CURSOR_RULES_DIR.as_posix(),
+        ":(glob)**/AGENTS.md",
+        *sorted(outputs),
+        f"scripts/{Path(__file__).name}",
+    ]
+
+
+def changed_since(root: Path, ref: str) -> set[Path]:
+    """ref から作業ツリーまでに変わった、同期に関係するパスを返す。
+
+    追跡済みファイルの変更は git diff で、まだ add していない新規ファイル（.gitignore 対象を除く）は
+    git ls-files --others で集める。``{{routing-table}}`` を使う場合は新しい playbook を
+    置くだけで生成物が変わるため、新規ファイルも含める。
+    """
+    changed: set[Path] = set()
+    for command, label in (
+        (["diff", "--name-only", "--relative", "-z", ref, "--"], "git diff"),
+        (["ls-files", "--others", "--exclude-standard", "-z", "--"], "git ls-files"),
+    ):
+        result = subprocess.run(
+            ["git", "-C", str(root), *command, *git_pathspecs()],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=False,
+        )
+        if result.returncode != 0:
+            message = result.stderr.decode("utf-8", errors="replace").strip()
+            raise ValueError(f"{label} failed for --since {ref}: {message or 'unknown error'}")
+        changed.update(Path(name) for name in result.stdout.decode("utf-8").split("\0") if name)
+    return changed
+
+
+def since_selection(
+    root: Path, changed: set[Path], selection: TargetSelection
+) -> TargetSelection:
+    """変更が playbook 本文とその生成物だけなら、その playbook だけを読む選択に絞る。
+
+    playbook の frontmatter を使う対象（index と、表を生成するときの task-routing を使う対象）は
+    選択に残す。
+    """
+    playbook_names: list[str] = []
+    for rel_path in sorted(changed):
+        if rel_path.parent not in (PLAYBOOK_CANONICAL_DIR, PLAYBOOK_OUTPUT_DIR):
+            return selection
+        if not (root / PLAYBOOK_CANONICAL_DIR / rel_path.name).is_file():
+            return selection
+        if rel_path.stem not in playbook_names:
+            playbook_names.append(rel_path.stem)
+    if selection.playbooks is not None:
+        playbook_names = [name for name in playbook_names if name in selection.playbooks]
+    generated_routing = any(
+        "routing" in OUTPUT_TARGETS[name].canonical_keys for name in selection.outputs
+    ) and has_routing_table_placeholder(read_canonical_file(root, CANONICAL_FILES["routing"]))
+    outputs = tuple(
+        name
+        for name in selection.outputs
+        if OUTPUT_TARGETS[name].playbook_inputs
+        or (generated_routing and "routing" in OUTPUT_TARGETS[name].canonical_keys)
+    )
+    return TargetSelection(outputs, tuple(playbook_names))
+
+
+def affected_outputs(root: Path, state: SyncState, changed: set[Path]) -> set[Path]:
+    """変更されたパスの影響を受ける出力（入力が変わった出力と、出力自体が変わったもの）を返す。
+
+    canonical・参照資料の下で削除されたパスや、どの出力の入力でもないパスは、影響先を
+    依存関係から判断できない（ルーティングや include の変化を伴う）ため全出力を対象にする。
+    """
+    if Path("scripts") / Path(__file__).name in changed:
+        return set(state.dependencies)
+    inputs_in_use = {path for inputs in state.dependencies.values() for path in inputs}
+    input_dirs = (CANONICAL_DIR, PLAYBOOK_ASSETS_DIR)
+    for rel_path in changed:
+        if not any(rel_path.is_relative_to(input_dir) for input_dir in input_dirs):
+            continue
+        if rel_path not in inputs_in_use or not (root / rel_path).is_file():
+            return set(state.dependencies)
+    return {
+        rel_path
+        for rel_path, inputs in state.dependencies.items()
+        if rel_path in changed or not changed.isdisjoint(inputs)
+    }
+
+
+class StagedBlobReader:
+    """1 本の ``git cat-file --batch`` プロセスで、インデックス上のファイル内容を読む。
+
+    ``:./<path>`` をプロセスへ書き込み、応答ヘッダのサイズ分だけ本文を読む。
+    複数スレッドから呼ばれても要求と応答が混ざらないようにロックする。
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.process = subprocess.Popen(
+            ["git", "-C", str(root), "cat-file", "--batch"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self.lock = threading.Lock()
+
+    def __enter__(self) -> StagedBlobReader:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def __call__(self, rel_path: Path) -> str:
+        """インデックス上の内容を返す。ステージされていなければ FileNotFoundError にする。"""
+        assert self.process.stdin is not None and self.process.stdout is not None
+        with self.lock:
+            try:
+                self.process.stdin.write(f":./{rel_path.as_posix()}\n".encode("utf-8"))
+                self.process.stdin.flush()
+            except BrokenPipeError:
+                header = b""
+            else:
+                header = self.process.stdout.readline()
+            if not header:
+                error = self.process.stderr.read() if self.process.stderr else b""
+                message = error.decode("utf-8", errors="replace").strip()
+                raise ValueError(f"git cat-file --batch failed: {message or 'no output'}")
+            fields = header.split()
+            if len(fields) != 3 or fields[1] != b"blob":
+                raise FileNotFoundError(f"not in the index: {rel_path.as_posix()}")
+            data = self.process.stdout.read(int(fields[2]) + 1)[:-1]
+        return data.decode("utf-8")
+
+    def list_files(self, rel_dir: Path) -> list[Path]:
+        """rel_dir 配下でインデックスにあるファイルを返す。"""
+        result = subprocess.run(
+            ["git", "-C", str(self.root), "ls-files", "-z", "--", rel_dir.as_posix()],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=False,
+        )
+        if result.returncode != 0:
+            message = result.stderr.decode("utf-8", errors="replace").strip()
+            raise ValueError(f"git ls-files failed: {message or 'unknown error'}")
+        return [Path(name) for name in result.stdout.decode("utf-8").split("\0") if name]
+
+    def close(self) -> None:
+        """プロセスを終了する。"""
+        if self.process.stdin is not None:
+            self.process.stdin.close()
+        self.process.wait()
+        for stream in (self.process.stdout, self.process.stderr):
+            if stream is not None:
+                stream.close()
+
+
+class SyncServer:
+    """解析済みの同期状態をメモリに保持し、check / sync 要求をプロセス内で実行する。
+
+    要求のたびに canonical の stat だけを取り直し、変わったファイルがあれば
+    refresh_sync_state で該当する入力だけを読み直す。
+    """
+
+    def __init__(self, root: Path, jobs: int = 1) -> None:
+        self.root = root
+        self.jobs = jobs
+        self.states: dict[TargetSelection, SyncState] = {}
+        self.snapshot = snapshot_canonical(root)
+
+    def state_for(self, selection: TargetSelection) -> SyncState:
+        """canonical の変更を反映した、selection 用の同期状態を返す。"""
+        current = snapshot_canonical(self.root)
+        if current != self.snapshot:
+            changed = changed_paths(self.snapshot, current)
+            for cached_selection, state in list(self.states.items()):
+                try:
+                    self.states[cached_selection], _ = refresh_sync_state(
+                        self.root, state, changed
+                    )
+                except FileNotFoundError:
+                    del self.states[cached_selection]
+            self.snapshot = current
+        if selection not in self.states:
+            self.states[selection] = load_sync_state(self.root, self.jobs, selection)
+        return self.states[selection]
+
+    def handle(self, request: dict) -> dict:
+        """要求（CLI 引数）を実行し、終了コードと出力を返す。
+
+        対象外のルートや常駐向きでないオプションには fallback を返し、クライアント側で
+        プロセス内実行させる。
+        """
+        output = io.StringIO()
+        errors = io.StringIO()
+        with redirect_stdout(output), redirect_stderr(errors):
+            try:
+                args = parse_args([str(value) for value in request.get("argv", [])])
+            except SystemExit as exc:
+                returncode = exc.code if isinstance(exc.code, int) else 2
+                return {
+                    "returncode": returncode,
+                    "output": output.getvalue(),
+                    "errors": errors.getvalue(),
+                }
+            if Path(args.root).resolve() != self.root or any(
+                getattr(args, option) for option in SERVER_UNSUPPORTED_OPTIONS
+            ):
+                return {"fallback": True}
+            try:
+                returncode = run(args, state=self.state_for(args.only))
+            except (OSError, ValueError) as exc:
+                self.states.clear()
+                print(f"[NG] {exc}")
+                returncode = 1
+        return {"returncode": returncode, "output": output.getvalue(), "errors": errors.getvalue()}
+
+
+def server_socket_path(root: Path, socket_path: str | None) -> Path:
+    """同期サーバーの Unix ソケットのパスを返す。"""
+    return Path(socket_path) if socket_path else root / SERVER_SOCKET_PATH
+
+
+def read_message(connection: socket.socket) -> bytes:
+    """改行までの 1 メッセージを受信する。"""
+    chunks: list[bytes] = []
+    while True:
+        chunk = connection.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        if chunk.endswith(b"\n"):
+            break
+    return b"".join(chunks)
+
+
+def serve(root: Path, args: argparse.Namespace) -> int:
+    """解析済みの状態を保持したまま、Unix ソケットで check / sync 要求を待ち受ける。"""
+    if not hasattr(socket, "AF_UNIX"):
+        print("[NG] Unix domain sockets are not available on this platform.")
+        return 1
+    socket_path = server_socket_path(root, args.socket)
+    if socket_path.exists():
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(str(socket_path))
+            except OSError:
+                socket_path.unlink()
+            else:
+                print(f"[NG] A sync server is already listening on {socket_path}.")
+                return 1
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+
+    server = SyncServer(root, jobs=args.jobs)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+        listener.bind(str(socket_path))
+        listener.listen()
+        print(f"[SERVE] Listening on {socket_path} (Ctrl+C to stop)", flush=True)
+        try:
+            while True:
+                connection, _ = listener.accept()
+                with connection:
+                    try:
+                        request = json.loads(read_message(connection) or b"{}")
+                    except ValueError:
+                        continue
+                    response = server.handle(request if isinstance(request, dict) else {})
+                    try:
+                        connection.sendall(json.dumps(response).encode("utf-8") + b"\n")
+                    except OSError:
+                        continue
+        except KeyboardInterrupt:
+            return 0
+        finally:
+            socket_path.unlink(missing_ok=True)
+
+
+def estimate_tokens(text: str) -> int:
+    """ネットワーク tokenizer を使わずにモデルのトークン数を概算する。
+
+    英字の連続は 4 文字ごとに 1、数字の連続は 3 桁ごとに 1、改行の連続は 1、
+    それ以外の記号・かな・漢字は 1 文字 1 トークンとして数える。
+    """
+    tokens = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        piece = match.group(0)
+        first = piece[0]
+        if first.isascii() and first.isalpha():
+            tokens += (len(piece) + 3) // 4
+        elif first.isascii() and first.isdigit():
+            tokens += (len(piece) + 2) // 3
+        else:
+            tokens += 1
+    return tokens
+
+
+def split_sections(content: str) -> list[tuple[str, str]]:
+    """レベル 2 以下の見出しで (見出し, 本文) に分割する。先頭部分は (preamble)。"""
+    sections: list[tuple[str, list[str]]] = [("(preamble)", [])]
+    in_fence = False
+    for line in content.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            in_fence = not in_fence
+        heading = None if in_fence else MARKDOWN_HEADING_PATTERN.match(stripped)
+        if heading is not None and len(heading.group(1)) <= 2:
+            sections.append((heading.group(2), [line]))
+        else:
+            sections[-1][1].append(line)
+    return [(title, "\n".join(lines)) for title, lines in sections if "".join(lines).strip()]
+
+
+def source_documents(
+    canonical: dict[str, MarkdownDocument], playbooks: dict[str, MarkdownDocument]
+) -> dict[Path, MarkdownDocument]:
+    """入力の相対パスから解析済み文書を引ける対応表を返す。"""
+    documents = {CANONICAL_FILES[key]: document for key, document in canonical.items()}
+    for playbook_name, document in playbooks.items():
+        documents[PLAYBOOK_CANONICAL_DIR / f"{playbook_name}.md"] = document
+    return documents
+
+
+def analyze_tokens(outputs: dict[Path, str], state: SyncState) -> list[dict]:
+    """AGENTS.md と Cursor rule ごとに、見出し単位・入力ファイル単位の推定トークン数を返す。"""
+    documents = source_documents(state.canonical, state.playbooks)
+    canonical_keys = {rel_path: key for key, rel_path in CANONICAL_FILES.items()}
+    # ``{{routing-table}}`` は展開後の表で照合し、表の分も task-routing に数える
+    context = RenderContext(state.canonical, state.playbook_routes, state.playbooks)
+    analysis: list[dict] = []
+    for rel_path, content in outputs.items():
+        key = rel_path.as_posix()
+        if not any(fnmatch.fnmatch(key, pattern) for pattern in TOKEN_BUDGET_TARGETS):
+            continue
+        total = estimate_tokens(content)
+        sections = [
+            {"title": title, "tokens": estimate_tokens(text)}
+            for title, text in split_sections(content)
+        ]
+        sources: dict[str, int] = {}
+        includes: dict[str, list[str]] = {}
+        for input_path in state.dependencies.get(rel_path, []):
+            document = documents.get(input_path)
+            if document is None:
+                # include 断片は展開済みの取り込み元の本文に含めて数える
+                continue
+            canonical_key = canonical_keys.get(input_path, "")
+            for fragment in (unscoped_body(document), document.body, document.content):
+                fragment = context.with_routing_table(canonical_key, fragment)
+                if fragment and fragment in content:
+                    sources[input_path.as_posix()] = estimate_tokens(fragment)
+                    included = sorted(
+                        {
+                            target.as_posix()
+                            for targets in document.includes.values()
+                            for target in targets
+                        }
+                    )
+                    if included:
+                        includes[input_path.as_posix()] = included
+                    break
+        sources["(generated)"] = max(total - sum(sources.values()), 0)
+        analysis.append(
+            {
+                "path": key,
+                "tokens": total,
+                "sections": sections,
+                "sources": sources,
+                "includes": includes,
+            }
+        )
+    return analysis
+
+
+def load_token_budgets(path: str | None) -> dict[str, dict]:
+    """トークン予算を返す。path 指定時は JSON の内容で既定値を上書きする。"""
+    budgets = {pattern: dict(budget) for pattern, budget in DEFAULT_TOKEN_BUDGETS.items()}
+    if path:
+        overrides = json.loads(Path(path).read_text(encoding="utf-8"))
+        for pattern, budget in overrides.items():
+            budgets.setdefault(pattern, {}).update(budget)
+    return budgets
+
+
+def budget_for(rel_path: str, budgets: dict[str, dict]) -> dict | None:
+    """出力パスに一致する予算を返す。完全一致を glob より優先する。"""
+    if rel_path in budgets:
+        return budgets[rel_path]
+    for pattern, budget in budgets.items():
+        if fnmatch.fnmatch(rel_path, pattern):
+            return budget
+    return None
+
+
+def check_token_budgets(analysis: list[dict], budgets: dict[str, dict]) -> list[str]:
+    """予算超過の内容を返す。
+
+    予算は {"total": 上限, "max_section_share": 既定の割合, "sections": {見出し: 割合}} で、
+    見出しの上限は total × 割合とする。
+    """
+    violations: list[str] = []
+    for entry in analysis:
+        budget = budget_for(entry["path"], budgets)
+        if not budget or "total" not in budget:
+            continue
+        total_budget = budget["total"]
+        if entry["tokens"] > total_budget:
+            violations.append(f"{entry['path']}: {entry['tokens']} tokens > budget {total_budget}")
+        section_shares = budget.get("sections", {})
+        default_share = budget.get("max_section_share")
+        for section in entry["sections"]:
+            share = section_shares.get(section["title"], default_share)
+            if share is None:
+                continue
+            limit = int(total_budget * share)
+            if section["tokens"] > limit:
+                violations.append(
+                    f"{entry['path']} section \"{section['title']}\": "
+                    f"{section['tokens']} tokens > {share:.0%} of {total_budget} ({limit})"
+                )
+    return violations
+
+
+def report_tokens(analysis: list[dict], budgets: dict[str, dict], violations: list[str]) -> int:
+    """トークン分析結果を表示し、終了コードを返す。"""
+    for entry in analysis:
+        budget = budget_for(entry["path"], budgets) or {}
+        limit = f" (budget {budget['total']})" if "total" in budget else ""
+        print(f"[TOKENS] {entry['path']}: ~{entry['tokens']} tokens{limit}")
+        print("  sections:")
+        for section in entry["sections"]:
+            share = section["tokens"] / entry["tokens"] if entry["tokens"] else 0.0
+            print(f"    {section['tokens']:>7}  {share:6.1%}  {section['title']}")
+        print("  sources:")
+        for source, tokens in sorted(entry["sources"].items(), key=lambda item: -item[1]):
+            print(f"    {tokens:>7}  {source}")
+            for fragment in entry["includes"].get(source, []):
+                print(f"             + {fragment} (included)")
+    if violations:
+        print("[NG] Token budget exceeded:")
+        for violation in violations:
+            print(f"  - {violation}")
+        return 1
+    print("[OK] Token budgets are satisfied.")
+    return 0
+
+
+def compact_table_row(stripped: str) -> str:
+    """表の行のセル余白と区切り行のハイフンを詰める。コードや \\| を含む行はそのまま返す。"""
+    if "`" in stripped or "\\|" in stripped:
+        return stripped
+    cells = [cell.strip() for cell in stripped.strip("|").split("|")]
+    if all(TABLE_SEPARATOR_CELL_PATTERN.fullmatch(cell) for cell in cells):
+        cells = [
+            (":" if cell.startswith(":") else "") + "---" + (":" if cell.endswith(":") else "")
+            for cell in cells
+        ]
+    return "| " + " | ".join(cells) + " |"
+
+
+def compact_markdown(text: str) -> str:
+    """意味を変えずに生成 Markdown を詰める。
+
+    行末空白の除去（2 つ以上の空白による改行指定は残す）、連続する空行の 1 行化、表の余白の圧縮、
+    別の見出しの下で既出の箇条書き（同じ階層で子要素を持たないもの）の削除を行う。
+    frontmatter・コードブロック・番号付き手順の中は変更しない（手順ごとの箇条書きは削除しない）。
+    """
+    lines = text.splitlines()
+    compacted: list[str] = []
+    # (インデント, 本文) -> 最初に現れたセクションの番号
+    seen_bullets: dict[tuple[int, str], int] = {}
+    section = 0
+    ordered_indent: int | None = None
+    in_frontmatter = bool(lines) and lines[0] == "---"
+    in_fence = False
+    for index, line in enumerate(lines):
+        if in_frontmatter:
+            compacted.append(line)
+            if index > 0 and line.startswith("---"):
+                in_frontmatter = False
+            continue
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            in_fence = not in_fence
+            compacted.append(line.rstrip())
+            continue
+        if in_fence:
+            compacted.append(line)
+            continue
+        if not stripped:
+            if compacted and compacted[-1]:
+                compacted.append("")
+            continue
+        if stripped.startswith("|"):
+            indent = line[: len(line) - len(line.lstrip())]
+            compacted.append(indent + compact_table_row(stripped))
+            continue
+        indent = len(line) - len(line.lstrip())
+        bullet = MARKDOWN_BULLET_PATTERN.match(stripped)
+        if MARKDOWN_HEADING_PATTERN.match(stripped):
+            section += 1
+            ordered_indent = None
+        elif MARKDOWN_ORDERED_ITEM_PATTERN.match(stripped):
+            if ordered_indent is None or indent < ordered_indent:
+                ordered_indent = indent
+        elif bullet is None and ordered_indent is not None and indent <= ordered_indent:
+            # 手順と同じ深さの地の文が来たら番号付きリストは終わり
+            ordered_indent = None
+        if bullet is not None and ordered_indent is None:
+            following = lines[index + 1] if index + 1 < len(lines) else ""
+            has_children = bool(following.strip()) and (
+                len(following) - len(following.lstrip()) > indent
+            )
+            key = (indent, " ".join(stripped[bullet.end() :].split()))
+            first_section = seen_bullets.get(key)
+            if not has_children and first_section is not None and first_section != section:
+                continue
+            if not has_children and first_section is None:
+                seen_bullets[key] = section
+        hard_break = line.endswith("  ") and index + 1 < len(lines) and lines[index + 1].strip()
+        compacted.append(line.rstrip() + ("  " if hard_break else ""))
+    while compacted and not compacted[-1]:
+        compacted.pop()
+    return "\n".join(compacted) + "\n"
+
+
+def compact_outputs(
+    outputs: dict[Path, str],
+) -> tuple[dict[Path, str], dict[Path, tuple[int, int]]]:
+    """出力を詰め、(詰めた出力, 出力ごとの (削減バイト数, 削減推定トークン数)) を返す。
+
+    箇条書きの重複は出力ごとに判定する。各エージェントは自分向けの出力だけを読むため、
+    出力をまたぐ重複（AGENTS.md と 00-global.mdc など）は残す。
+    """
+    compacted: dict[Path, str] = {}
+    savings: dict[Path, tuple[int, int]] = {}
+    with PROFILER.span("compact"):
+        for rel_path, content in outputs.items():
+            # playbook は canonical の逐語コピーなので詰めない
+            if rel_path.suffix == ".json" or rel_path.parent == PLAYBOOK_OUTPUT_DIR:
+                compacted[rel_path] = content
+                continue
+            original = normalized_content(content)
+            compacted[rel_path] = compact_markdown(original)
+            savings[rel_path] = (
+                len(original.encode("utf-8")) - len(compacted[rel_path].encode("utf-8")),
+                estimate_tokens(original) - estimate_tokens(compacted[rel_path]),
+            )
+    return compacted, savings
+
+
+def report_compaction(savings: dict[Path, tuple[int, int]]) -> None:
+    """出力ごとの削減量を表示する。"""
+    if not savings:
+        return
+    print("[OK] Compacted generated files (saved bytes / estimated tokens):")
+    for rel_path, (saved_bytes, saved_tokens) in savings.items():
+        print(f"  - {rel_path}: {saved_bytes} bytes / {saved_tokens} tokens")
+    total_bytes = sum(saved_bytes for saved_bytes, _ in savings.values())
+    total_tokens = sum(saved_tokens for _, saved_tokens in savings.values())
+    print(f"  total: {total_bytes} bytes / {total_tokens} tokens")
+
+
+def report_changed(changed: list[Path]) -> None:
+    """書き込み結果を表示する。"""
     if changed:
         print("[OK] Updated generated files:")
         for rel_path in changed:
             print(f"  - {rel_path}")
     else:
         print("[OK] No changes needed.")
+
+
+def report_drift(drift: list[Path]) -> int:
+    """drift 検知結果を表示し、終了コードを返す。"""
+    if drift:
+        print("[NG] Generated files are out of date:")
+        for rel_path in drift:
+            print(f"  - {rel_path}")
+        print("Run: python3 scripts/sync_ai_context.py")
+        return 1
+    print("[OK] Generated files are up to date.")
+    return 0
+
+
+def init_fleet_worker(
+    outputs: dict[Path, str],
+    input_hashes: dict[str, str],
+    dependencies: dict[Path, list[Path]],
+    digests: dict[Path, str],
+    output_names: tuple[str, ...],
+) -> None:
+    """fleet ワーカーに共有の生成結果を 1 度だけ渡す。"""
+    _FLEET_STATE["outputs"] = outputs
+    _FLEET_STATE["input_hashes"] = input_hashes
+    _FLEET_STATE["dependencies"] = dependencies
+    _FLEET_STATE["digests"] = digests
+    _FLEET_STATE["output_names"] = output_names
+
+
+def sync_fleet_repository(
+    root_path: str,
+    check: bool,
+    use_cache: bool,
+    header_only: bool,
+    fail_fast: bool,
+    compact: bool = False,
+) -> FleetResult:
+    """共有の生成結果を 1 リポジトリへ書き込む、または drift を検査する。
+
+    生成されなくなった出力（scope を外したディレクトリ側の AGENTS.md など）は、同期時に削除し、
+    検査時は drift として報告する。
+    """
+    root = Path(root_path)
+    outputs: dict[Path, str] = _FLEET_STATE["outputs"]
+    input_hashes: dict[str, str] = _FLEET_STATE["input_hashes"]
+    dependencies: dict[Path, list[Path]] = _FLEET_STATE["dependencies"]
+    output_names: tuple[str, ...] = _FLEET_STATE["output_names"]
+    result = FleetResult(root=root_path)
+    try:
+        if not root.is_dir():
+            raise FileNotFoundError(f"missing repository root: {root}")
+        if check and header_only:
+            drift = check_output_headers(root, _FLEET_STATE["digests"], fail_fast=fail_fast)
+            if not (drift and fail_fast):
+                drift.extend(orphaned_outputs(root, dependencies, output_names))
+            result.drift = [rel_path.as_posix() for rel_path in drift]
+            return result
+
+        manifest = load_manifest(root) if use_cache else {}
+        targets = stale_outputs(root, manifest, input_hashes, dependencies, compact)
+        selected = {rel_path: outputs[rel_path] for rel_path in targets}
+        if check:
+            drift = check_outputs(root, selected, fail_fast=fail_fast)
+            verified = {path: content for path, content in selected.items() if path not in drift}
+            if not (drift and fail_fast):
+                drift.extend(orphaned_outputs(root, dependencies, output_names))
+            result.drift = [rel_path.as_posix() for rel_path in drift]
+        else:
+            changed = write_outputs(root, selected)
+            changed.extend(remove_orphaned_outputs(root, dependencies, output_names))
+            verified = selected
+            result.changed = [rel_path.as_posix() for rel_path in changed]
+        if selected and use_cache:
+            save_manifest(
+                root,
+                update_manifest(root, manifest, input_hashes, dependencies, verified, compact),
+            )
+    except (OSError, ValueError) as exc:
+        result.error = str(exc)
+    return result
+
+
+def read_fleet_roots(fleet_roots: list[str], fleet_list: str | None) -> list[Path]:
+    """--fleet-root と --fleet-list から同期先リポジトリ一覧を重複なく返す。"""
+    candidates = [Path(path) for path in fleet_roots]
+    if fleet_list:
+        list_path = Path(fleet_list)
+        for line in list_path.read_text(encoding="utf-8").splitlines():
+            entry = line.split("#", 1)[0].strip()
+            if entry:
+                candidates.append(list_path.parent / entry)
+    roots: list[Path] = []
+    seen: set[Path] = set()
+    for candidate in candidates:
+        resolved = candidate.resolve()
+        if resolved not in seen:
+            roots.append(resolved)
+            seen.add(resolved)
+    return roots
+
+
+def run_fleet(
+    roots: list[Path],
+    outputs: dict[Path, str],
+    state: SyncState,
+    args: argparse.Namespace,
+) -> list[FleetResult]:
+    """複数リポジトリへの同期をプロセスプールで実行し、入力順の結果を返す。"""
+    shared = (outputs, state.input_hashes, state.dependencies, state.digests, state.output_names)
+    options = (args.check, not args.no_cache, args.header_only, args.fail_fast, args.compact)
+    root_paths = [str(root) for root in roots]
+    if args.jobs <= 1:
+        init_fleet_worker(*shared)
+        return [sync_fleet_repository(root_path, *options) for root_path in root_paths]
+
+    with ProcessPoolExecutor(
+        max_workers=args.jobs, initializer=init_fleet_worker, initargs=shared
+    ) as executor:
+        futures = [
+            executor.submit(sync_fleet_repository, root_path, *options) for root_path in root_paths
+        ]
+        return [future.result() for future in futures]
+
+
+def report_fleet(results: list[FleetResult], check: bool) -> int:
+    """fleet モードの集計結果を表示し、終了コードを返す。"""
+    changed = [result for result in results if result.changed]
+    drifted = [result for result in results if result.drift]
+    failed = [result for result in results if result.error]
+    for result in changed:
+        print(f"[CHANGED] {result.root}")
+        for rel_path in result.changed:
+            print(f"  - {rel_path}")
+    for result in drifted:
+        print(f"[DRIFT] {result.root}")
+        for rel_path in result.drift:
+            print(f"  - {rel_path}")
+    for result in failed:
+        print(f"[FAILED] {result.root}: {result.error}")
+
+    summary = (
+        f"{len(results)} repositories: {len(changed)} changed, "
+        f"{len(drifted)} drifted, {len(failed)} failed"
+    )
+    if failed or (check and drifted):
+        print(f"[NG] Fleet sync: {summary}")
+        return 1
+    print(f"[OK] Fleet sync: {summary}")
+    return 0
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """CLI 引数を解析する。argv 省略時は sys.argv を使う。"""
+    parser = argparse.ArgumentParser(description="AI context files synchronizer")
+    parser.add_argument("--check", action="store_true", help="差分検知のみ実施して終了する")
+    parser.add_argument(
+        "--root",
+        default=".",
+        help="テンプレートリポジトリのルートパス（既定: カレントディレクトリ）",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=f"manifest（.git/{MANIFEST_GIT_PATH}）を使わず全出力を再生成・比較する",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="読み込み・比較・書き込みに使うスレッド数。fleet モードではプロセス数（既定: 1）",
+    )
+    parser.add_argument(
+        "--fail-fast",
+        action="store_true",
+        help="--check 時、最初の差分を検知した時点で打ち切る",
+    )
+    parser.add_argument(
+        "--header-only",
+        action="store_true",
+        help=(
+            "--check 時に出力を再生成せず、ヘッダの入力ダイジェストだけを照合する"
+            "（生成ファイル本文の手編集は検知しない）"
+        ),
+    )
+    parser.add_argument(
+        "--fleet-root",
+        action="append",
+        default=[],
+        help="--root の canonical から生成した出力を配布するリポジトリ。複数指定可",
+    )
+    parser.add_argument(
+        "--fleet-list",
+        help="配布先リポジトリのパスを 1 行 1 件で列挙したファイル（# 以降はコメント）",
+    )
+    parser.add_argument(
+        "--only",
+        action="append",
+        default=[],
+        metavar="TARGET",
+        help=(
+            "生成・検査する対象を絞る。agents / cursor / claude / copilot / index / playbooks / "
+            "playbook:<name> "
+            "または対象名（例: cursor_global）。複数指定可"
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help=(
+            "フェーズ・ファイル単位の時間/入出力バイト数/ピークメモリを JSON で書き出す"
+            "（- で標準出力）"
+        ),
+    )
+    parser.add_argument(
+        "--profile-trace",
+        metavar="PATH",
+        help="計測結果を Chrome trace 形式（chrome://tracing / Perfetto）で書き出す",
+    )
+    parser.add_argument(
+        "--token-report",
+        action="store_true",
+        help=(
+            "AGENTS.md と Cursor rule の推定トークン数を見出し・入力ファイル単位で表示し、"
+            "予算超過があれば失敗する（書き込みは行わない）"
+        ),
+    )
+    parser.add_argument(
+        "--token-budgets",
+        metavar="PATH",
+        help=(
+            "トークン予算の JSON。出力パス（glob 可）ごとに "
+            '{"total": N, "max_section_share": 0.6, "sections": {"見出し": 0.3}} を指定する'
+        ),
+    )
+    parser.add_argument(
+        "--staged",
+        action="store_true",
+        help=(
+            "--check 時、作業ツリーではなくインデックス（ステージ済みの内容）の canonical と"
+            "生成物を 1 本の git cat-file --batch で読み、コミットされる内容を検査する"
+        ),
+    )
+    parser.add_argument(
+        "--since",
+        metavar="REF",
+        help=(
+            "REF から変更された canonical・参照資料・生成物だけを git diff で調べ、"
+            "影響する出力に絞って生成・検査する。変更がなければ何も読まずに終了する"
+        ),
+    )
+    parser.add_argument(
+        "--explain",
+        metavar="OUTPUT",
+        help="出力ファイル（例: AGENTS.md）が依存する入力を include の入れ子つきで表示する",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help=(
+            "生成物の空白・表の余白・同一出力内で重複する箇条書きを詰め、"
+            "出力ごとの削減バイト数と推定トークン数を表示する"
+        ),
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help=(
+            "docs/ai/canonical/** と docs/ai/playbook-assets/** を監視し、"
+            "変更のたびに影響する出力だけを再生成する"
+        ),
+    )
+    parser.add_argument(
+        "--watch-interval",
+        type=float,
+        default=0.2,
+        help="--watch のポーリング間隔（秒、既定: 0.2）",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help=(
+            "解析済みの canonical を保持する常駐サーバーを起動し、Unix ソケットで "
+            "check / sync 要求に応える（クライアント: scripts/sync_ai_context_client.py）"
+        ),
+    )
+    parser.add_argument(
+        "--socket",
+        metavar="PATH",
+        help=f"--serve で使う Unix ソケットのパス（既定: <root>/{SERVER_SOCKET_PATH.as_posix()}）",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=0.15,
+        help="--watch で連続保存をまとめる待ち時間（秒、既定: 0.15）",
+    )
+    args = parser.parse_args(argv)
+    if args.staged and not args.check:
+        parser.error("--staged requires --check")
+    try:
+        args.only = parse_only(args.only)
+    except ValueError as exc:
+        parser.error(str(exc))
+    return args
+
+
+def write_profile(args: argparse.Namespace) -> None:
+    """--profile / --profile-trace の指定先へ計測結果を書き出す。"""
+    if args.profile:
+        content = json.dumps(PROFILER.report(), ensure_ascii=False, indent=2) + "\n"
+        if args.profile == "-":
+            sys.stdout.write(content)
+        else:
+            Path(args.profile).write_text(content, encoding="utf-8")
+    if args.profile_trace:
+        content = json.dumps(PROFILER.chrome_trace(), ensure_ascii=False) + "\n"
+        Path(args.profile_trace).write_text(content, encoding="utf-8")
+
+
+def check_staged(root: Path, args: argparse.Namespace, reader: TextReader) -> int:
+    """インデックス上の canonical から生成した結果と、インデックス上の生成物を比較する。
+
+    コミットされる内容そのものを検査するため manifest は使わない。生成されなくなった
+    Cursor rule の検出は作業ツリーの走査が必要なため行わない。
+    """
+    state = load_sync_state(root, jobs=args.jobs, selection=args.only, reader=reader)
+    if args.header_only:
+        drift = check_output_headers(
+            root, state.digests, jobs=args.jobs, fail_fast=args.fail_fast, reader=reader
+        )
+        return report_drift(drift)
+    outputs = build_outputs(
+        state.canonical, state.playbook_routes, state.playbooks, digests=state.digests
+    )
+    if args.compact:
+        outputs, _ = compact_outputs(outputs)
+    if OUTPUT_FILES["agents"] in outputs:
+        size_validation = validate_agents_size(outputs)
+        if size_validation != 0:
+            return size_validation
+    drift = check_outputs(root, outputs, jobs=args.jobs, fail_fast=args.fail_fast, reader=reader)
+    return report_drift(drift)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """メイン処理。"""
+    args = parse_args(argv)
+    if args.profile or args.profile_trace:
+        PROFILER.enable()
+    try:
+        return run(args)
+    except (FileNotFoundError, ValueError) as exc:
+        print(f"[NG] {exc}")
+        return 1
+    finally:
+        if args.profile or args.profile_trace:
+            write_profile(args)
+
+
+def run(args: argparse.Namespace, state: SyncState | None = None) -> int:
+    """CLI 引数に従って同期・検査を実行する。state を渡すと canonical を読み直さずに使う。"""
+    root = Path(args.root).resolve()
+    if args.watch:
+        return watch(root, args)
+    if args.serve:
+        return serve(root, args)
+
+    if args.staged:
+        with StagedBlobReader(root) as reader:
+            return check_staged(root, args, reader)
+
+    since_changes: set[Path] | None = None
+    if args.since:
+        since_changes = changed_since(root, args.since)
+        if not since_changes:
+            print(f"[OK] No AI context files changed since {args.since}.")
+            return 0
+
+    if state is None:
+        selection = args.only
+        if since_changes is not None:
+            selection = since_selection(root, since_changes, selection)
+        state = load_sync_state(root, jobs=args.jobs, selection=selection)
+    affected = None if since_changes is None else affected_outputs(root, state, since_changes)
+
+    if args.explain:
+        rel_path = Path(args.explain)
+        if rel_path.is_absolute():
+            rel_path = rel_path.resolve().relative_to(root)
+        if rel_path not in state.dependencies:
+            print(f"[NG] Unknown output: {args.explain}")
+            return 1
+        documents = source_documents(state.canonical, state.playbooks)
+        for line in explain_output(rel_path, state.dependencies, documents, state.input_hashes):
+            print(line)
+        return 0
+
+    if args.token_report:
+        outputs = build_outputs(
+            state.canonical, state.playbook_routes, state.playbooks, digests=state.digests
+        )
+        if args.compact:
+            outputs, _ = compact_outputs(outputs)
+        budgets = load_token_budgets(args.token_budgets)
+        analysis = analyze_tokens(outputs, state)
+        return report_tokens(analysis, budgets, check_token_budgets(analysis, budgets))
+
+    if args.fleet_root or args.fleet_list:
+        fleet_roots = read_fleet_roots(args.fleet_root, args.fleet_list)
+        outputs = build_outputs(
+            state.canonical, state.playbook_routes, state.playbooks, digests=state.digests
+        )
+        if args.compact:
+            outputs, savings = compact_outputs(outputs)
+            report_compaction(savings)
+        if OUTPUT_FILES["agents"] in outputs:
+            size_validation = validate_agents_size(outputs)
+            if size_validation != 0:
+                return size_validation
+        results = run_fleet(fleet_roots, outputs, state, args)
+        return report_fleet(results, args.check)
+
+    if args.check and args.header_only:
+        digests = state.digests
+        if affected is not None:
+            digests = {path: digest for path, digest in digests.items() if path in affected}
+        drift = check_output_headers(root, digests, jobs=args.jobs, fail_fast=args.fail_fast)
+        if not (drift and args.fail_fast):
+            drift.extend(orphaned_outputs(root, state.dependencies, state.output_names))
+        return report_drift(drift)
+
+    use_cache = not args.no_cache
+    manifest = load_manifest(root) if use_cache else {}
+    targets = set(
+        stale_outputs(root, manifest, state.input_hashes, state.dependencies, args.compact)
+    )
+    if affected is not None:
+        targets &= affected
+
+    if args.check:
+        outputs = build_outputs(
+            state.canonical,
+            state.playbook_routes,
+            state.playbooks,
+            targets=targets,
+            digests=state.digests,
+        )
+        if args.compact:
+            outputs, savings = compact_outputs(outputs)
+            report_compaction(savings)
+        if OUTPUT_FILES["agents"] in outputs:
+            size_validation = validate_agents_size(outputs)
+            if size_validation != 0:
+                return size_validation
+        drift = check_outputs(root, outputs, jobs=args.jobs, fail_fast=args.fail_fast)
+        if not (drift and args.fail_fast):
+            drift.extend(orphaned_outputs(root, state.dependencies, state.output_names))
+        if outputs and use_cache:
+            verified = {path: content for path, content in outputs.items() if path not in drift}
+            save_manifest(
+                root,
+                update_manifest(
+                    root,
+                    manifest,
+                    state.input_hashes,
+                    state.dependencies,
+                    verified,
+                    args.compact,
+                ),
+            )
+        return report_drift(drift)
+
+    result = sync_state_outputs(root, state, targets, manifest, args.jobs, use_cache, args.compact)
+    if result is None:
+        return 1
+    changed, _ = result
+    report_changed(changed)
     return 0
 
 
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""常駐の同期サーバーへ sync_ai_context.py の実行を依頼する。サーバーがなければ同じプロセスで実行する。
+
+pre-commit やエディタのフックから ``python3 scripts/sync_ai_context_client.py --check`` のように
+sync_ai_context.py と同じ引数で呼び出す。サーバーは ``python3 scripts/sync_ai_context.py --serve``
+で起動する。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import socket
+import sys
+from pathlib import Path
+
+SERVER_SOCKET_PATH = Path(".cache/ai-context-sync/server.sock")
+TIMEOUT_SECONDS = 60.0
+
+
+def resolve_options(argv: list[str]) -> tuple[Path, Path]:
+    """引数から (ルートパス, ソケットパス) を取り出す。他の引数の解釈はサーバーに任せる。"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--root", default=".")
+    parser.add_argument("--socket")
+    known, _ = parser.parse_known_args(argv)
+    root = Path(known.root).resolve()
+    socket_path = Path(known.socket) if known.socket else root / SERVER_SOCKET_PATH
+    return root, socket_path
+
+
+def request_server(socket_path: Path, argv: list[str]) -> dict | None:
+    """サーバーに実行を依頼し、応答を返す。サーバーがない・代行できない場合は None を返す。"""
+    if not hasattr(socket, "AF_UNIX") or not socket_path.exists():
+        return None
+    message = json.dumps({"argv": argv}).encode("utf-8") + b"\n"
+    chunks: list[bytes] = []
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(TIMEOUT_SECONDS)
+            client.connect(str(socket_path))
+            client.sendall(message)
+            while True:
+                chunk = client.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                if chunk.endswith(b"\n"):
+                    break
+        response = json.loads(b"".join(chunks))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(response, dict) or response.get("fallback"):
+        return None
+    return response
+
+
+def run_in_process(argv: list[str]) -> int:
+    """サーバーを使わず sync_ai_context.py を同じプロセスで実行する。"""
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import sync_ai_context
+
+    return sync_ai_context.main(argv)
+
+
+def main() -> int:
+    """メイン処理。"""
+    argv = sys.argv[1:]
+    root, socket_path = resolve_options(argv)
+    response = request_server(socket_path, [*argv, "--root", str(root)])
+    if response is None:
+        return run_in_process(argv)
+    sys.stdout.write(response.get("output", ""))
+    sys.stderr.write(response.get("errors", ""))
+    return int(response.get("returncode", 1))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
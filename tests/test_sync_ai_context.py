@@ -0,0 +1,65 @@
+"""scripts/sync_ai_context.py の --since まわりの回帰テスト。"""
+
+from __future__ import annotations
+
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+SYNC_SCRIPT = Path("scripts/sync_ai_context.py")
+PLAYBOOK = Path("docs/ai/canonical/playbooks/git-commit.md")
+
+
+def git(root: Path, *args: str) -> None:
+    """テスト用リポジトリで git を実行する。"""
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=root,
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+
+
+def sync(root: Path, *args: str) -> subprocess.CompletedProcess[str]:
+    """テスト用リポジトリで同期スクリプトを実行する。"""
+    return subprocess.run(
+        [sys.executable, str(SYNC_SCRIPT), *args],
+        cwd=root,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        check=False,
+    )
+
+
+class SinceTest(unittest.TestCase):
+    """--since の結果が全体の --check と食い違わないことを確認する。"""
+
+    def setUp(self) -> None:
+        self.root = Path(tempfile.mkdtemp(prefix="sync-ai-context-test-"))
+        self.addCleanup(shutil.rmtree, self.root)
+        shutil.copytree(REPO_ROOT / "docs/ai", self.root / "docs/ai")
+        (self.root / "scripts").mkdir()
+        shutil.copy2(REPO_ROOT / SYNC_SCRIPT, self.root / SYNC_SCRIPT)
+        git(self.root, "init", "-q")
+        self.assertEqual(sync(self.root, "--no-cache").returncode, 0)
+        git(self.root, "add", "-A")
+        git(self.root, "commit", "-q", "-m", "initial")
+
+    def test_deleted_input_is_checked_like_full_check(self) -> None:
+        git(self.root, "rm", "-q", PLAYBOOK.as_posix())
+
+        full = sync(self.root, "--check", "--no-cache")
+        since = sync(self.root, "--check", "--no-cache", "--since", "HEAD")
+
+        self.assertNotEqual(full.returncode, 0, full.stdout)
+        self.assertEqual(since.returncode, full.returncode, since.stdout)
+        self.assertEqual(since.stdout, full.stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()